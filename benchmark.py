@@ -0,0 +1,85 @@
+import os
+import time
+import click
+import tempfile
+from uploader import CowUploader, MuseUploader
+
+
+def run(make_uploader, upload_path: str, processes: int) -> dict:
+    """上传一次，返回耗时统计"""
+    cpu_start, start = os.times(), time.time()
+    thread = make_uploader(upload_path, processes)
+    succeed = thread.start_upload()
+    cpu_end, elapsed = os.times(), time.time() - start
+    size = sum(f["file_size"] for f in thread.file_dict.values())
+    return {
+        "mode": f"{processes} 进程" if processes else "线程",
+        "succeed": succeed,
+        "err": thread.err,
+        "seconds": elapsed,
+        "speed": size / elapsed / 1048576,
+        "cpu": sum(cpu_end[:4]) - sum(cpu_start[:4]),  # 含已结束的子进程
+        "network_time": thread.upload_info["network_time"]
+    }
+
+
+def bench(make_uploader, upload_path: str, size: int, processes: tuple):
+    """依次以线程模式与多进程模式上传同一文件并输出对比"""
+    temp_path = ""
+    if not upload_path:
+        fd, temp_path = tempfile.mkstemp(suffix=".bin")
+        with os.fdopen(fd, "wb") as f:
+            for _ in range(size):
+                f.write(os.urandom(1048576))
+        upload_path = temp_path
+    try:
+        results = [run(make_uploader, upload_path, p) for p in (0,) + tuple(processes)]
+    finally:
+        if temp_path:
+            os.remove(temp_path)
+    click.echo(f"{'模式':<8}{'耗时(秒)':>10}{'速度(MB/s)':>12}{'CPU(秒)':>10}{'分片耗时(秒)':>14}")
+    for r in results:
+        if not r["succeed"]:
+            click.echo(f"{r['mode']:<8}失败：{r['err']}")
+            continue
+        click.echo(f"{r['mode']:<8}{r['seconds']:>10.2f}{r['speed']:>12.2f}{r['cpu']:>10.2f}{r['network_time']:>14.2f}")
+
+
+@click.group()
+def cli():
+    """对比线程模式与多进程模式的上传速度"""
+    pass
+
+
+@cli.command()
+@click.option("--authorization", type=str, prompt="用户 authorization", help="用户 authorization", required=True)
+@click.option("--remember_mev2", type=str, prompt="用户 remember-mev2", help="用户 remember-mev2", required=True)
+@click.option("--upload_path", type=str, help="待上传文件（默认生成随机数据的临时文件）", default="")
+@click.option("--size", type=int, help="临时文件大小（MB）", default=1024, show_default=True)
+@click.option("--chunk_size", type=int, help="分块大小（字节）", default=8388608, show_default=True)
+@click.option("--threads", type=int, help="上传并发数", default=16, show_default=True)
+@click.option("--processes", type=int, multiple=True, help="对比的上传进程数（可多次指定）", default=[os.cpu_count() or 4])
+def cow(authorization, remember_mev2, upload_path, size, chunk_size, threads, processes):
+    """CowTransfer - 奶牛快传"""
+    bench(lambda path, p: CowUploader(authorization, remember_mev2, path, title="benchmark", chunk_size=chunk_size,
+                                      threads=threads, progress=False, processes=p),
+          upload_path, size, processes)
+
+
+@cli.command()
+@click.option("--client_id", type=str, prompt="client_id", help="client_id", required=True)
+@click.option("--client_key", type=str, prompt="client_key", help="client_key", required=True)
+@click.option("--upload_path", type=str, help="待上传文件（默认生成随机数据的临时文件）", default="")
+@click.option("--size", type=int, help="临时文件大小（MB）", default=1024, show_default=True)
+@click.option("--chunk_size", type=int, help="分块大小（字节）", default=8388608, show_default=True)
+@click.option("--threads", type=int, help="上传并发数", default=16, show_default=True)
+@click.option("--processes", type=int, multiple=True, help="对比的上传进程数（可多次指定）", default=[os.cpu_count() or 4])
+def muse(client_id, client_key, upload_path, size, chunk_size, threads, processes):
+    """MuseTransfer"""
+    bench(lambda path, p: MuseUploader(client_id, client_key, path, title="benchmark", chunk_size=chunk_size,
+                                       threads=threads, progress=False, processes=p),
+          upload_path, size, processes)
+
+
+if __name__ == "__main__":
+    cli()
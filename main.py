@@ -1,4 +1,6 @@
+import multiprocessing
 import uploader
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     uploader.cli()
@@ -1,3 +1,4 @@
 from .cli import cli
 from .cowtransfer import CowUploader
 from .musetransfer import MuseUploader
+from .aio import AsyncCowUploader, AsyncMuseUploader
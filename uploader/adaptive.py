@@ -0,0 +1,122 @@
+import time
+import oss2
+import threading
+
+debug = False
+
+# 自适应模式下分片失败（限流等）的重试次数
+RETRIES = 3
+
+
+def log(text: str) -> str:
+    if debug:
+        print(text)
+    return text
+
+
+def is_throttled(exc: Exception) -> bool:
+    """是否为可重试的错误（限流、服务端错误、超时或连接失败）"""
+    if isinstance(exc, oss2.exceptions.RequestError):
+        return True
+    if isinstance(exc, oss2.exceptions.OssError):
+        return exc.status == 429 or exc.status >= 500 or exc.code in ["RequestTimeout", "ServiceUnavailable"]
+    return False
+
+
+class AdaptiveLimiter:
+
+    def __init__(self,
+                 min_limit: int = 1,
+                 max_limit: int = 5,
+                 decrease: float = 0.5,
+                 latency_factor: float = 2.0):
+        """
+        自适应分片并发配额（加性增、乘性减），用法同 threading.Semaphore
+        每轮（完成 limit 个分片）结束时评估：
+            出现错误或限流：并发乘以 decrease
+            单位字节耗时超过历史最低值的 latency_factor 倍且吞吐未提升：并发乘以 (1 + decrease) / 2
+            吞吐未下降：并发加 1
+        :param min_limit: 最小并发数
+        :param max_limit: 最大并发数
+        :param decrease: 出现错误时的并发缩减系数（默认 0.5）
+        :param latency_factor: 判定时延膨胀的倍数（默认 2 倍）
+        """
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+
+        self.limit = self.min_limit
+        self.in_flight = 0
+        self.cond = threading.Condition()
+
+        # 当前轮统计
+        self.round_start = time.time()
+        self.round_parts = 0
+        self.round_bytes = 0
+        self.round_seconds = 0.0
+        self.round_errors = 0
+        self.last_goodput = 0.0
+        self.base_latency = None  # 历史最低单位字节耗时
+        self.decreased_at = 0.0  # 上次缩减时间，此前发出的分片失败不再重复缩减
+
+    def acquire(self):
+        """获取配额"""
+        with self.cond:
+            while self.in_flight >= self.limit:
+                self.cond.wait()
+            self.in_flight += 1
+        return True
+
+    def release(self):
+        """释放配额"""
+        with self.cond:
+            self.in_flight -= 1
+            self.cond.notify()
+
+    def record(self, seconds: float, size: int, error: bool = False):
+        """
+        记录分片结果
+        :param seconds: 分片耗时
+        :param size: 分片大小
+        :param error: 是否失败（错误或限流）
+        """
+        with self.cond:
+            if error:
+                self.round_errors += 1
+            else:
+                self.round_parts += 1
+                self.round_bytes += size
+                self.round_seconds += seconds
+            if error and time.time() - seconds >= self.decreased_at:
+                self.set_limit(int(self.limit * self.decrease), "错误或限流")
+            if self.round_parts + self.round_errors >= self.limit:
+                self.end_round()
+
+    def end_round(self):
+        """结束一轮并调整并发"""
+        elapsed = max(time.time() - self.round_start, 1e-6)
+        goodput = self.round_bytes / elapsed
+        if self.round_bytes:
+            latency = self.round_seconds / self.round_bytes
+            if self.base_latency is None or latency < self.base_latency:
+                self.base_latency = latency
+            if not self.round_errors:
+                if latency > self.base_latency * self.latency_factor and goodput <= self.last_goodput:
+                    self.set_limit(int(self.limit * (1 + self.decrease) / 2), "时延膨胀")
+                elif goodput >= self.last_goodput * 0.95:
+                    self.set_limit(self.limit + 1, "吞吐提升")
+            self.last_goodput = goodput
+        self.round_start = time.time()
+        self.round_parts = self.round_bytes = self.round_errors = 0
+        self.round_seconds = 0.0
+
+    def set_limit(self, limit: int, reason: str):
+        """设置并发数（调用时需持有锁）"""
+        limit = min(max(limit, self.min_limit), self.max_limit)
+        if limit < self.limit:
+            self.decreased_at = time.time()
+        if limit != self.limit:
+            log(f"并发 {self.limit} -> {limit}（{reason}）")
+            self.limit = limit
+            self.cond.notify_all()
@@ -0,0 +1,617 @@
+import os
+import abc
+import hmac
+import base64
+import asyncio
+import hashlib
+import mimetypes
+from urllib.parse import quote
+from email.utils import formatdate
+from xml.etree import ElementTree
+from . import cowtransfer, musetransfer
+
+debug = False
+
+
+def log(text: str) -> str:
+    if debug:
+        print(text)
+    return text
+
+
+def import_aiohttp():
+    """按需导入 aiohttp"""
+    try:
+        import aiohttp
+    except ImportError:
+        raise ImportError("异步上传需安装 aiohttp")
+    return aiohttp
+
+
+async def cancel_all(tasks: list):
+    """取消并等待任务结束"""
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class OssError(Exception):
+
+    def __init__(self, status: int, body: bytes):
+        self.status = status
+        self.code, self.message = "", body.decode("utf-8", "replace")
+        try:
+            root = ElementTree.fromstring(body)
+            self.code = root.findtext("Code", "")
+            self.message = root.findtext("Message", self.message)
+        except ElementTree.ParseError:
+            pass
+        super(OssError, self).__init__(f"OSS 返回 {status} {self.code}：{self.message}")
+
+
+class AsyncBucket:
+
+    def __init__(self,
+                 session,
+                 access_key_id: str,
+                 access_key_secret: str,
+                 security_token: str,
+                 endpoint: str,
+                 bucket_name: str):
+        """
+        基于 aiohttp 的 OSS 分片上传（签名版本 1，STS 凭证）
+        :param session: aiohttp.ClientSession
+        :param access_key_id: 临时 AccessKeyId
+        :param access_key_secret: 临时 AccessKeySecret
+        :param security_token: 临时 SecurityToken
+        :param endpoint: 访问域名（可带协议头，默认 https）
+        :param bucket_name: bucket 名称
+        """
+        self.session = session
+        self.access_key_id = access_key_id
+        self.access_key_secret = access_key_secret
+        self.security_token = security_token
+        self.bucket_name = bucket_name
+        scheme, _, host = endpoint.rpartition("://")
+        self.base_url = f"{scheme or 'https'}://{bucket_name}.{host.strip('/')}"
+
+    def sign(self, method: str, key: str, params: dict, headers: dict) -> str:
+        """计算签名"""
+        oss_headers = sorted((k.lower(), v) for k, v in headers.items() if k.lower().startswith("x-oss-"))
+        resource = f"/{self.bucket_name}/{key}"
+        if params:
+            resource += "?" + "&".join(k if v is None else f"{k}={v}" for k, v in sorted(params.items()))
+        string_to_sign = "\n".join([
+            method, headers.get("Content-MD5", ""), headers.get("Content-Type", ""), headers["Date"],
+            "".join(f"{k}:{v}\n" for k, v in oss_headers) + resource
+        ])
+        digest = hmac.new(self.access_key_secret.encode(), string_to_sign.encode(), hashlib.sha1).digest()
+        return f"OSS {self.access_key_id}:{base64.b64encode(digest).decode()}"
+
+    async def request(self, method: str, key: str, params: dict, content_type: str = "", data: bytes = b"") -> tuple:
+        """发送已签名请求，返回 (响应头, 响应体)"""
+        headers = {
+            "Date": formatdate(usegmt=True),
+            "x-oss-security-token": self.security_token
+        }
+        if content_type:
+            headers["Content-Type"] = content_type
+        headers["Authorization"] = self.sign(method, key, params, headers)
+        query = "&".join(k if v is None else f"{k}={quote(str(v), safe='')}" for k, v in params.items())
+        url = f"{self.base_url}/{quote(key)}" + (f"?{query}" if query else "")
+        async with self.session.request(method, url, headers=headers, data=data or None) as resp:
+            body = await resp.read()
+            if resp.status >= 300:
+                raise OssError(resp.status, body)
+            return resp.headers, body
+
+    async def init_multipart_upload(self, key: str) -> str:
+        """初始化分片上传，返回 upload_id"""
+        content_type = mimetypes.guess_type(key)[0] or "application/octet-stream"
+        _, body = await self.request("POST", key, {"uploads": None}, content_type)
+        return ElementTree.fromstring(body).findtext("UploadId")
+
+    async def upload_part(self, key: str, upload_id: str, part_number: int, data: bytes) -> str:
+        """上传分片，返回 etag"""
+        headers, _ = await self.request(
+            "PUT", key, {"partNumber": part_number, "uploadId": upload_id}, "application/octet-stream", data
+        )
+        return headers["ETag"].strip('"')
+
+    async def complete_multipart_upload(self, key: str, upload_id: str, parts: list) -> str:
+        """完成分片上传，parts 为 (分片序号, etag) 列表，返回 etag"""
+        data = "<CompleteMultipartUpload>" + "".join(
+            f"<Part><PartNumber>{num}</PartNumber><ETag>\"{etag}\"</ETag></Part>" for num, etag in sorted(parts)
+        ) + "</CompleteMultipartUpload>"
+        _, body = await self.request("POST", key, {"uploadId": upload_id}, "application/xml", data.encode())
+        return ElementTree.fromstring(body).findtext("ETag", "").strip('"')
+
+    async def abort_multipart_upload(self, key: str, upload_id: str):
+        """取消分片上传"""
+        await self.request("DELETE", key, {"uploadId": upload_id})
+
+
+class AsyncUploader(abc.ABC):
+
+    def __init__(self,
+                 upload_path: str,
+                 chunk_size: int = 2097152,
+                 threads: int = 5,
+                 session=None,
+                 limiter: asyncio.Semaphore = None):
+        """
+        异步上传基类，子类实现 steps 与 upload_one，文件信息与参数检查复用同步上传类的模块函数
+        :param upload_path: 待上传文件或目录路径，如果是目录将上传该目录里的所有文件
+        :param chunk_size: 分块大小（单位：字节，默认 2097152 字节，即 2 MB）
+        :param threads: 分片并发数（默认 5）
+        :param session: 复用的 aiohttp.ClientSession（默认新建）
+        :param limiter: 分片并发配额，可在多个上传间共享（默认为 threads）
+        """
+        self.aiohttp = import_aiohttp()
+
+        # 参数
+        self.upload_path = upload_path
+        self.chunk_size = chunk_size
+        self.threads = threads
+        self.session = session
+        self.limiter = limiter
+
+        # 信息
+        self.err = ""
+        self.done = False
+        self.file_dict = {}
+        self.upload_info = {
+            "complete": False
+        }
+        self.transfer_info = {}
+        self.auth_headers = {}
+
+        # 对象
+        self.task = None
+        self.running = None
+        self.listeners = []
+
+    @abc.abstractmethod
+    def steps(self) -> list:
+        """上传步骤，[(步骤名称, 协程函数), ...]"""
+
+    @abc.abstractmethod
+    async def upload_one(self, file_id, file_info: dict) -> bool:
+        """上传单个文件"""
+
+    # 上传
+    async def upload(self) -> bool:
+        """执行上传（可 await，取消所在任务即取消上传）"""
+        self.task = asyncio.current_task()
+        self.running = asyncio.Event()
+        self.running.set()
+        self.limiter = self.limiter or asyncio.Semaphore(self.threads)
+        own_session = self.session is None
+        if own_session:
+            self.session = self.aiohttp.ClientSession()
+        try:
+            for step, func in self.steps():
+                log(f"{step}……")
+                try:
+                    if not await func():
+                        log(f"{step} {self.err}")
+                        return False
+                except (self.aiohttp.ClientError, OssError, KeyError, ValueError) as exc:
+                    self.err = f"异常：{exc}"
+                    log(f"{step} {self.err}")
+                    return False
+            return True
+        except asyncio.CancelledError:
+            self.err = "已取消上传"
+            raise
+        finally:
+            if own_session:
+                await self.session.close()
+                self.session = None
+            self.done = True
+            self.emit(None)
+
+    # 继续
+    def work(self):
+        """继续"""
+        if self.running:
+            self.running.set()
+
+    # 暂停
+    def pause(self):
+        """暂停"""
+        if self.running:
+            self.running.clear()
+
+    # 取消
+    def cancel(self):
+        """取消"""
+        if self.task:
+            self.task.cancel()
+
+    async def progress(self):
+        """进度（异步迭代器），上传结束后停止"""
+        if self.done:
+            return
+        queue = asyncio.Queue()
+        self.listeners.append(queue)
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    return
+                yield event
+        finally:
+            self.listeners.remove(queue)
+
+    def emit(self, event):
+        """推送进度"""
+        for queue in self.listeners:
+            queue.put_nowait(event)
+
+    async def request(self, method: str, url: str, **kwargs) -> dict:
+        """请求接口"""
+        async with self.session.request(method, url, headers=self.auth_headers, **kwargs) as resp:
+            return await resp.json(content_type=None)
+
+    async def upload_file(self) -> bool:
+        """并发上传全部文件"""
+        files = asyncio.Semaphore(self.threads)
+
+        async def upload(file_id, file_info):
+            async with files:
+                return await self.upload_one(file_id, file_info)
+
+        tasks = [asyncio.ensure_future(upload(k, v)) for k, v in self.file_dict.items()]
+        try:
+            return all(await asyncio.gather(*tasks))
+        except asyncio.CancelledError:
+            await asyncio.gather(*tasks, return_exceptions=True)  # 子任务已随之取消，等待其清理完毕
+            raise
+        except BaseException:
+            await cancel_all(tasks)
+            raise
+
+    async def upload_object(self, bucket: AsyncBucket, key: str, file_info: dict) -> str:
+        """分片上传单个文件，返回 etag"""
+        loop = asyncio.get_event_loop()
+        upload_id = await bucket.init_multipart_upload(key)
+        parts, tasks = [], []
+
+        async def upload_part(part_num, part_data, permit):
+            while not self.running.is_set():  # 暂停期间归还配额，供其他上传使用
+                permit["held"] = False
+                self.limiter.release()
+                await self.running.wait()
+                await self.limiter.acquire()
+                permit["held"] = True
+            etag = await bucket.upload_part(key, upload_id, part_num, part_data)
+            parts.append((part_num, etag))
+            file_info["uploaded_size"] += len(part_data)
+            self.upload_info["uploaded_size"] = self.upload_info.get("uploaded_size", 0) + len(part_data)
+            self.emit({
+                "file": file_info["file_name"],
+                "file_size": file_info["file_size"],
+                "file_uploaded": file_info["uploaded_size"],
+                "total_size": self.upload_info["total_size"],
+                "uploaded_size": self.upload_info["uploaded_size"]
+            })
+
+        def release(permit):
+            if permit["held"]:  # 取消时同样归还配额
+                self.limiter.release()
+
+        try:
+            with open(file_info["abs_path"], "rb") as f:
+                chunk_id = 0
+                while True:
+                    await self.running.wait()
+                    await self.limiter.acquire()
+                    if not self.running.is_set():
+                        self.limiter.release()
+                        continue
+                    chunk_bytes = await loop.run_in_executor(None, f.read, self.chunk_size)  # 磁盘读取无法异步
+                    if len(chunk_bytes) == 0 and chunk_id > 0:
+                        self.limiter.release()
+                        break
+                    chunk_id += 1
+                    permit = {"held": True}
+                    task = asyncio.ensure_future(upload_part(chunk_id, chunk_bytes, permit))
+                    task.add_done_callback(lambda _, permit=permit: release(permit))
+                    tasks.append(task)
+                    if len(chunk_bytes) < self.chunk_size:
+                        break
+            await asyncio.gather(*tasks)
+            return await bucket.complete_multipart_upload(key, upload_id, parts)
+        except BaseException:
+            await cancel_all(tasks)
+            try:
+                await asyncio.shield(bucket.abort_multipart_upload(key, upload_id))
+            except Exception:
+                pass
+            raise
+
+
+class AsyncCowUploader(AsyncUploader):
+
+    def __init__(self,
+                 authorization: str,
+                 remember_mev2: str,
+                 upload_path: str,
+                 folder_name: str = "",
+                 title: str = "",
+                 message: str = "",
+                 valid_days: int = 7,
+                 chunk_size: int = 2097152,
+                 threads: int = 5,
+                 session=None,
+                 limiter: asyncio.Semaphore = None):
+        """
+        实例化对象
+        :param authorization: 用户 authorization
+        :param remember_mev2: 用户 remember-mev2
+        :param upload_path: 待上传文件或目录路径，如果是目录将上传该目录里的所有文件
+        :param folder_name: 如果含有子文件夹，将所有文件上传至此文件夹中
+        :param title: 传输标题（默认为空）
+        :param message: 传输描述（默认为空）
+        :param valid_days: 传输有效期（单位：天数，默认 7 天）
+        :param chunk_size: 分块大小（单位：字节，默认 2097152 字节，即 2 MB）
+        :param threads: 分片并发数（默认 5）
+        :param session: 复用的 aiohttp.ClientSession（默认新建）
+        :param limiter: 分片并发配额，可在多个上传间共享（默认为 threads）
+        """
+        super(AsyncCowUploader, self).__init__(upload_path, chunk_size, threads, session, limiter)
+        self.authorization = authorization
+        self.remember_mev2 = remember_mev2
+        self.folder_name = folder_name
+        self.title = title
+        self.message = message
+        self.valid_days = valid_days
+        self.auth_headers = {
+            "cookie": f"{self.remember_mev2}; cow-auth-token={self.authorization}",
+            "authorization": self.authorization
+        }
+
+    def steps(self) -> list:
+        return [
+            ("检查", self.check),
+            ("获取专属域名", self.get_subdomain),
+            ("初始化传输", self.init_transfer),
+            ("初始化文件夹分片", self.init_folders),
+            ("上传文件", self.upload_file),
+            ("完成上传", self.finish),
+        ]
+
+    async def check(self) -> bool:
+        """检查"""
+        if not all([self.remember_mev2, self.authorization]):
+            self.err = "错误：缺少 remember_mev2 或 authorization"
+            return False
+        if not os.path.exists(self.upload_path):
+            self.err = "错误：待上传文件或目录不存在"
+            return False
+        return True
+
+    async def get_subdomain(self) -> bool:
+        """获取专属域名"""
+        resp_json = await self.request("GET", "https://cowtransfer.com/api/generic/v3/initial")
+        sub_domain = resp_json["account"]["subDomain"]
+        self.upload_info["url_prefix"] = f"https://{sub_domain}.cowtransfer.com/s/" if sub_domain \
+            else "https://cowtransfer.com/s/"
+        return True
+
+    async def init_transfer(self) -> bool:
+        """初始化传输"""
+        resp_json = await self.request("POST", "https://cowtransfer.com/core/api/transfer", json={
+            "name": self.title,
+            "message": self.message,
+            "validDays": self.valid_days,
+            "enableDownload": True,
+            "enablePreview": True,
+            "enableSaveTo": True
+        })
+        if resp_json.get("code") != "0000":
+            self.err = f"返回：{resp_json}"
+            return False
+        self.transfer_info.update(resp_json["data"])
+        self.upload_info["transfer_url"] = self.upload_info["url_prefix"] + resp_json["data"]["uniqueUrl"]
+        self.upload_info["transfer_code"] = resp_json["data"]["downloadCode"]
+        return True
+
+    async def init_folders(self) -> bool:
+        """初始文件夹结构"""
+        self.upload_info["mode"], file_dict = cowtransfer.scan_files(self.upload_path)
+        self.file_dict.update(file_dict)
+        self.upload_info["total_size"] = sum(f["file_size"] for f in self.file_dict.values())
+        if self.upload_info["mode"] != "folders":
+            return True
+
+        # 在云端分批创建文件夹，各批次的剩余子树并发创建
+        folder_ids = {}
+        batches = asyncio.Semaphore(self.threads)
+
+        async def create_folders(parent_id: str, local_folder: dict) -> str:
+            included, req_folder = cowtransfer.folder_batch(local_folder)
+            async with batches:
+                resp_json = await self.request("POST", f"https://cowtransfer.com/core/api/dam/folders/{parent_id}/dfs",
+                                               json={"folder": req_folder, "handle_conflict": True})
+            ids, deferred = cowtransfer.match_folders(local_folder, resp_json, included)
+            folder_ids.update(ids)
+            await asyncio.gather(*[create_folders(folder_id, child) for folder_id, child in deferred])
+            return resp_json["id"]
+
+        local_folder = cowtransfer.local_folders(self.upload_path, self.folder_name)
+        self.upload_info["folder_id"] = await create_folders("0", local_folder)
+        for file_info in self.file_dict.values():
+            file_info["folder_id"] = folder_ids[file_info["folder_path"]]
+        return True
+
+    async def upload_one(self, file_id: str, file_info: dict) -> bool:
+        """上传单个文件"""
+        log(f"开始上传：{file_info['rel_path']}……")
+        resp_json = await self.request("POST", "https://cowtransfer.com/core/api/filems/front/upload/tokens",
+                                       json={"file_format": file_info["file_format"]})
+        bucket = AsyncBucket(
+            self.session, resp_json["access_key_id"], resp_json["access_key_secret"],
+            resp_json["security_token"], resp_json["endpoint"], resp_json["bucket_name"]
+        )
+        await self.upload_object(bucket, resp_json["object_name"], file_info)
+        bind_json = await self.request("POST", "https://cowtransfer.com/core/api/dam/asset/files", json={
+            "folder_id": file_info["folder_id"],
+            "file_md5": "",
+            "file_sha1": "",
+            "second_transmission": False,
+            "file_info": {
+                "origin_url": f"{resp_json['host']}/{resp_json['object_name']}",
+                "size": file_info["file_size"],
+                "title": file_info["file_name"]
+            }
+        })
+        if "content_id" not in bind_json:
+            self.err = f"绑定文件 {file_info['rel_path']} 失败：{bind_json}"
+            return False
+        file_info["content_id"] = bind_json["content_id"]
+        file_info["uploaded"] = True
+        log(f"上传完成：{file_info['rel_path']}")
+        return True
+
+    async def finish(self) -> bool:
+        """完成传输"""
+        folders = self.upload_info["mode"] == "folders"
+        await self.request("POST", "https://cowtransfer.com/core/api/transfer/uploaded", json={
+            "files": [] if folders else [file["content_id"] for file in self.file_dict.values()],
+            "folders": [self.upload_info["folder_id"]] if folders else [],
+            "guid": self.transfer_info["guid"]
+        })
+        self.upload_info["complete"] = True
+        return True
+
+
+class AsyncMuseUploader(AsyncUploader):
+
+    def __init__(self,
+                 client_id: str,
+                 client_key: str,
+                 upload_path: str,
+                 title: str = "untitled",
+                 password: str = "",
+                 valid_days: int = 7,
+                 chunk_size: int = 2097152,
+                 threads: int = 5,
+                 session=None,
+                 limiter: asyncio.Semaphore = None):
+        """
+        实例化对象
+        :param client_id: client_id
+        :param client_key: client_key
+        :param upload_path: 待上传文件或目录路径，如果是目录将上传该目录里的所有文件
+        :param title: 分享链接的标题
+        :param password: 分享链接的密码（4位数字，默认无密码）
+        :param valid_days: 分享链接的有效期（默认 7 天，可选：7, 30, 365)
+        :param chunk_size: 分块大小（单位：字节，默认 2097152 字节，即 2 MB）
+        :param threads: 分片并发数（默认 5）
+        :param session: 复用的 aiohttp.ClientSession（默认新建）
+        :param limiter: 分片并发配额，可在多个上传间共享（默认为 threads）
+        """
+        super(AsyncMuseUploader, self).__init__(upload_path, chunk_size, threads, session, limiter)
+        self.client_id = client_id
+        self.client_key = client_key
+        self.title = title
+        self.password = password
+        self.expire = valid_days
+        self.bucket = None
+
+    def steps(self) -> list:
+        return [
+            ("检查", self.check),
+            ("获取访问令牌", self.get_token),
+            ("创建分享链接", self.create_share_url),
+            ("获取上传令牌", self.get_upload_token),
+            ("上传文件", self.upload_file),
+            ("完成上传", self.finish),
+        ]
+
+    async def check(self) -> bool:
+        """检查"""
+        if not all([self.client_id, self.client_key]):
+            self.err = "错误：缺少 client_id 或 client_key"
+            return False
+        if not os.path.exists(self.upload_path):
+            self.err = "错误：待上传文件或目录不存在"
+            return False
+        self.file_dict.update(musetransfer.scan_files(self.upload_path))
+        self.upload_info["total_size"] = sum(f["file_size"] for f in self.file_dict.values())
+        self.err = musetransfer.check_share(self.upload_info["total_size"], self.title, self.password, self.expire)
+        if self.err.startswith("错误"):
+            return False
+        if self.err:
+            log(self.err)
+        self.title = self.title[:64]  # official limited
+        return True
+
+    async def call(self, api: str, param, action: str):
+        """请求开放接口，失败时返回 None"""
+        resp_json = await self.request(
+            "POST", f"https://open-auth.tezign.com/open-api/standard/simple/v1/muse/{api}", json={"param": param}
+        )
+        if resp_json.get("code") != "0":
+            self.err = f"{action}失败：{resp_json.get('message', '未知原因')}"
+            return None
+        return resp_json.get("result") or True
+
+    async def get_token(self) -> bool:
+        """获取访问令牌"""
+        resp_json = await self.request("POST", "https://open-auth.tezign.com/open-api/oauth/get-token",
+                                       json={"clientId": self.client_id, "clientKey": self.client_key})
+        if resp_json.get("code") != "0":
+            self.err = f"请求获取访问令牌失败：{resp_json.get('message', '未知原因')}"
+            return False
+        self.auth_headers = {
+            "Access-token": resp_json["result"]["access_token"],
+            "Token-type": resp_json["result"]["token_type"]
+        }
+        return True
+
+    async def create_share_url(self) -> bool:
+        """创建分享链接"""
+        result = await self.call("create", {"pwd": self.password, "title": self.title, "expire": self.expire},
+                                 "请求创建分享链接")
+        if result is None:
+            return False
+        self.transfer_info["transfer_code"] = result
+        self.upload_info["transfer_url"] = "https://musetransfer.com/s/" + result
+        return True
+
+    async def get_upload_token(self) -> bool:
+        """获取上传令牌"""
+        result = await self.call("getUploadToken", self.transfer_info["transfer_code"], "请求获取上传凭证")
+        if result is None:
+            return False
+        self.transfer_info["upload_token"] = result
+        self.bucket = AsyncBucket(
+            self.session, result["accessKeyId"], result["accessKeySecret"], result["securityToken"],
+            result["endpoint"], result["bucket"]
+        )
+        return True
+
+    async def upload_one(self, file_id: int, file_info: dict) -> bool:
+        """上传单个文件"""
+        log(f"开始上传：{file_info['upl_path']}……")
+        upl_path = self.transfer_info["upload_token"]["pathPrefix"] + "/" + file_info["uuid_name"]
+        etag = await self.upload_object(self.bucket, upl_path, file_info)
+        result = await self.call("bindFile", {
+            "code": self.transfer_info["transfer_code"],
+            "filePathList": [{"etag": etag, "fileName": file_info["upl_path"].lstrip("\\"), "path": upl_path}],
+            "finish": 0
+        }, f"上传文件 {file_info['upl_path']} ")
+        if result is None:
+            return False
+        log(f"上传完成：{file_info['upl_path']}")
+        return True
+
+    async def finish(self) -> bool:
+        """完成传输"""
+        if await self.call("finish", self.transfer_info["transfer_code"], "请求完成传输") is None:
+            return False
+        self.upload_info["complete"] = True
+        return True
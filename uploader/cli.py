@@ -1,6 +1,9 @@
 import click
+from .packer import PACK_FORMATS
 from .cowtransfer import CowUploader
 from .musetransfer import MuseUploader
+from .server import UploadServer
+from .trace import Tracer
 
 
 @click.group()
@@ -9,6 +12,44 @@ def cli():
     pass
 
 
+def echo_pack(thread):
+    """输出打包统计"""
+    pack_info = thread.upload_info.get("pack")
+    if not pack_info or "raw_size" not in pack_info:
+        return
+    click.echo(f"打包：{pack_info['files']} 个文件，{pack_info['raw_size']} 字节压缩为 {pack_info['packed_size']} 字节"
+               f"（{pack_info['ratio']:.2%}），压缩 CPU 耗时 {pack_info['cpu_time']:.2f} 秒，"
+               f"打包耗时 {pack_info['pack_time']:.2f} 秒，网络耗时 {thread.upload_info['network_time']:.2f} 秒")
+
+
+def echo_dedup(thread):
+    """输出去重统计"""
+    dedup_info = thread.upload_info.get("dedup")
+    if not dedup_info:
+        return
+    click.echo(f"去重：{dedup_info['files']} 个文件无需上传，节省 {dedup_info['saved_size']} 字节")
+
+
+def echo_verify(thread):
+    """输出校验统计"""
+    verify_info = thread.upload_info.get("verify")
+    if not verify_info:
+        return
+    click.echo(f"校验：{verify_info['files']} 个文件，通过 {verify_info['ok']} 个，重新上传 {verify_info['reuploaded']} 个，"
+               f"失败 {verify_info['failed'] + verify_info['unbound']} 个，无法校验 {verify_info['unverified']} 个")
+    for detail in verify_info["details"]:
+        if detail["status"] == "unverified":
+            click.echo(f"无法校验：{detail['path']}（{detail['reason']}）")
+
+
+def echo_trace(thread, trace):
+    """导出耗时追踪并输出汇总"""
+    if not trace:
+        return
+    thread.tracer.dump(trace)
+    click.echo(f"耗时追踪已写入：{trace}\n{thread.tracer.format_summary()}")
+
+
 @cli.command()
 @click.option("--authorization", type=str, prompt="用户 authorization", help="用户 authorization", required=True)
 @click.option("--remember_mev2", type=str, prompt="用户 remember-mev2", help="用户 remember-mev2", required=True)
@@ -19,15 +60,39 @@ def cli():
 @click.option("--valid_days", type=int, help="传输有效期（天）", default=7, show_default=True)
 @click.option("--chunk_size", type=int, help="分块大小（字节）", default=2097152, show_default=True)
 @click.option("--threads", type=int, help="上传并发数", default=5, show_default=True)
-def cow(authorization, remember_mev2, upload_path, folder_name, title, message, valid_days, chunk_size, threads):
+@click.option("--pack", type=click.Choice(["", *PACK_FORMATS]), help="小文件打包压缩的格式（默认不打包）", default="")
+@click.option("--pack_max_size", type=int, help="不大于此大小的文件打包上传（字节）", default=1048576, show_default=True)
+@click.option("--pack_filter", type=str, multiple=True, help="打包的文件名通配规则，! 开头表示不打包（可多次指定）")
+@click.option("--pack_level", type=int, help="压缩级别（默认 tar.zst 为 3，zip 为 6）", default=None)
+@click.option("--pack_processes", type=int, help="压缩进程数（默认为 CPU 核心数）", default=None)
+@click.option("--trace", type=str, help="记录各阶段耗时并写入此 trace 文件（Chrome / Perfetto 格式）", default="")
+@click.option("--endpoint", type=str, multiple=True, help="候选 OSS 访问域名，指定后上传前测速选择最快的域名（可多次指定）")
+@click.option("--endpoint_ttl", type=int, help="访问域名测速结果缓存有效期（秒）", default=600, show_default=True)
+@click.option("--processes", type=int, help="上传进程数，大于 0 时多进程上传分片，并发为 min(processes, threads)（默认仅使用线程）", default=0)
+@click.option("--adaptive", is_flag=True, help="自适应调整上传并发，此时 --threads 为并发上限")
+@click.option("--min_threads", type=int, help="自适应模式的并发下限", default=1, show_default=True)
+@click.option("--dedup", is_flag=True, help="去重，内容相同的文件仅上传一次")
+@click.option("--verify", is_flag=True, help="完成传输前校验已上传文件，并重新上传校验失败的文件")
+@click.option("--verify_report", type=str, help="校验报告（JSON）写入路径", default="")
+def cow(authorization, remember_mev2, upload_path, folder_name, title, message, valid_days, chunk_size, threads,
+        pack, pack_max_size, pack_filter, pack_level, pack_processes, trace,
+        endpoint, endpoint_ttl, processes, adaptive, min_threads, dedup, verify, verify_report):
     """CowTransfer - 奶牛快传"""
     thread = CowUploader(authorization, remember_mev2, upload_path, folder_name,
-                         title, message, valid_days, chunk_size, threads)
+                         title, message, valid_days, chunk_size, threads,
+                         pack, pack_max_size, pack_filter, pack_level, pack_processes,
+                         tracer=Tracer() if trace else None, endpoints=endpoint, endpoint_ttl=endpoint_ttl,
+                         processes=processes, adaptive=adaptive, min_threads=min_threads,
+                         dedup=dedup, verify=verify, verify_report=verify_report)
     if thread.start_upload():
         click.echo(f"链接：{thread.upload_info.get('transfer_url')}\n"
                    f"口令：{thread.upload_info.get('transfer_code')}")
+        echo_pack(thread)
+        echo_dedup(thread)
     else:
         click.echo(f"上传失败，{thread.err}")
+    echo_verify(thread)
+    echo_trace(thread, trace)
     return thread
 
 
@@ -40,16 +105,56 @@ def cow(authorization, remember_mev2, upload_path, folder_name, title, message,
 @click.option("--valid_days", type=int, help="传输有效期（天）", default=7, show_default=True)
 @click.option("--chunk_size", type=int, help="分块大小（字节）", default=2097152, show_default=True)
 @click.option("--threads", type=int, help="上传并发数", default=5, show_default=True)
-def muse(client_id, client_key, upload_path, title, password, valid_days, chunk_size, threads):
+@click.option("--pack", type=click.Choice(["", *PACK_FORMATS]), help="小文件打包压缩的格式（默认不打包）", default="")
+@click.option("--pack_max_size", type=int, help="不大于此大小的文件打包上传（字节）", default=1048576, show_default=True)
+@click.option("--pack_filter", type=str, multiple=True, help="打包的文件名通配规则，! 开头表示不打包（可多次指定）")
+@click.option("--pack_level", type=int, help="压缩级别（默认 tar.zst 为 3，zip 为 6）", default=None)
+@click.option("--pack_processes", type=int, help="压缩进程数（默认为 CPU 核心数）", default=None)
+@click.option("--trace", type=str, help="记录各阶段耗时并写入此 trace 文件（Chrome / Perfetto 格式）", default="")
+@click.option("--endpoint", type=str, multiple=True, help="候选 OSS 访问域名，指定后上传前测速选择最快的域名（可多次指定）")
+@click.option("--endpoint_ttl", type=int, help="访问域名测速结果缓存有效期（秒）", default=600, show_default=True)
+@click.option("--processes", type=int, help="上传进程数，大于 0 时多进程上传分片，并发为 min(processes, threads)（默认仅使用线程）", default=0)
+@click.option("--adaptive", is_flag=True, help="自适应调整上传并发，此时 --threads 为并发上限")
+@click.option("--min_threads", type=int, help="自适应模式的并发下限", default=1, show_default=True)
+@click.option("--dedup", is_flag=True, help="去重，内容相同的文件仅上传一次")
+@click.option("--verify", is_flag=True, help="完成传输前校验已上传文件，并重新上传校验失败的文件")
+@click.option("--verify_report", type=str, help="校验报告（JSON）写入路径", default="")
+def muse(client_id, client_key, upload_path, title, password, valid_days, chunk_size, threads,
+         pack, pack_max_size, pack_filter, pack_level, pack_processes, trace,
+         endpoint, endpoint_ttl, processes, adaptive, min_threads, dedup, verify, verify_report):
     """MuseTransfer"""
     thread = MuseUploader(client_id, client_key, upload_path, title,
-                          password, valid_days, chunk_size, threads)
+                          password, valid_days, chunk_size, threads,
+                          pack, pack_max_size, pack_filter, pack_level, pack_processes,
+                          tracer=Tracer() if trace else None, endpoints=endpoint, endpoint_ttl=endpoint_ttl,
+                          processes=processes, adaptive=adaptive, min_threads=min_threads,
+                          dedup=dedup, verify=verify, verify_report=verify_report)
     if thread.start_upload():
         click.echo(f"链接：{thread.upload_info.get('transfer_url')}")
+        echo_pack(thread)
+        echo_dedup(thread)
     else:
         click.echo(f"上传失败，{thread.err}")
+    echo_verify(thread)
+    echo_trace(thread, trace)
     return thread
 
 
+@cli.command()
+@click.option("--host", type=str, help="监听地址", default="127.0.0.1", show_default=True)
+@click.option("--port", type=int, help="监听端口", default=7070, show_default=True)
+@click.option("--unix_socket", type=str, help="Unix 套接字路径（指定后不监听端口）", default="")
+@click.option("--max_parts", type=int, help="所有任务共享的分片并发上限", default=16, show_default=True)
+@click.option("--job_ttl", type=int, help="已结束任务的保留时长（秒）", default=3600, show_default=True)
+def serve(host, port, unix_socket, max_parts, job_ttl):
+    """常驻服务，通过本地 HTTP 接口提交上传任务"""
+    server = UploadServer(host, port, unix_socket, max_parts, job_ttl=job_ttl)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+    return server
+
+
 if __name__ == "__main__":
     cli()
@@ -3,12 +3,23 @@ import oss2
 import time
 import requests
 import threading
+import collections
 from tqdm import tqdm
-from oss2.models import PartInfo
 from concurrent.futures import ThreadPoolExecutor
+from .packer import PackMixin
+from .trace import NULL_TRACER, Tracer
+from .endpoint import EndpointSelector
+from .mpupload import ProcessDataPlane
+from .adaptive import AdaptiveLimiter
+from .parts import PartUploadMixin
+from .dedup import DedupMixin
+from .verify import VerifyMixin
 
 requests.adapters.DEFAULT_RETRIES = 3
 
+# 单次请求创建的文件夹数上限，超出部分拆分为子树并发创建
+FOLDER_BATCH_SIZE = 200
+
 debug = False
 
 
@@ -18,7 +29,130 @@ def log(text: str) -> str:
     return text
 
 
-class CowUploader(threading.Thread):
+def new_file_info(path: str, rel_path: str) -> dict:
+    """待上传文件信息"""
+    return {
+        "file_name": os.path.basename(path),
+        "file_format": os.path.basename(path).split(".")[-1] if "." in os.path.basename(path) else "unknow",
+        "rel_path": rel_path,
+        "abs_path": os.path.abspath(path),
+        "file_size": os.path.getsize(path),
+        "folder_id": "0",
+        "uploaded": False,
+        "uploaded_size": 0
+    }
+
+
+def scan_files(upload_path: str) -> tuple:
+    """
+    获取待上传文件信息
+    :param upload_path: 待上传文件或目录路径
+    :return: (上传模式 single / multiple / folders, 文件信息字典)，folders 模式下文件信息含所在文件夹 "folder_path"
+    """
+    # 单文件
+    if os.path.isfile(upload_path):
+        return "single", {"1": new_file_info(upload_path, "\\" + os.path.basename(upload_path))}
+
+    # 目录，判断是否含有子文件夹
+    mode = "multiple"
+    if any(map(lambda e: os.path.isdir(os.path.join(upload_path, e)), os.listdir(upload_path))):
+        mode = "folders"
+
+    # 遍历获取所有待上传文件信息
+    file_dict = {}
+    root_path = os.path.abspath(upload_path)
+    for root, dirs, files in os.walk(upload_path):
+        folder_path = os.path.relpath(os.path.abspath(root), root_path)
+        folder_path = "" if folder_path == "." else folder_path
+        for file in files:
+            path = os.path.join(root, file)
+            file_info = file_dict[str(len(file_dict) + 1)] = new_file_info(path, os.path.abspath(path).replace(root_path, ""))
+            if mode == "folders":
+                file_info["folder_id"] = None  # 所在文件夹创建完成后填入
+                file_info["folder_path"] = folder_path
+    return mode, file_dict
+
+
+def local_folders(upload_path: str, folder_name: str = "") -> dict:
+    """
+    获取本地文件夹结构
+    :param upload_path: 待上传目录路径
+    :param folder_name: 根文件夹名称（默认为上级目录名）
+    :return: {"title", "path", "children"}
+    """
+    def get_children(parent_path: str, rel_path: str):
+        """获取子文件夹"""
+        children_list = []
+        for child in os.listdir(parent_path):
+            if not os.path.isdir(os.path.join(parent_path, child)):
+                continue
+            children_list.append({
+                "title": child,
+                "path": os.path.join(rel_path, child),
+                "children": get_children(str(os.path.join(parent_path, child)), os.path.join(rel_path, child))
+            })
+        return children_list
+
+    return {
+        "title": folder_name or os.path.basename(os.path.split(upload_path)[0]),
+        "path": "",
+        "children": get_children(upload_path, "")
+    }
+
+
+def folder_batch(local_folder: dict) -> tuple:
+    """
+    按广度优先截取不超过 FOLDER_BATCH_SIZE 个文件夹的子树
+    :param local_folder: 本地文件夹结构
+    :return: (已截取的文件夹路径集合, 创建文件夹的请求结构)
+    """
+    included, queue = {local_folder["path"]}, collections.deque([local_folder])
+    while queue and len(included) < FOLDER_BATCH_SIZE:
+        for child in queue.popleft()["children"]:
+            if len(included) >= FOLDER_BATCH_SIZE:
+                break
+            included.add(child["path"])
+            queue.append(child)
+
+    def to_request(folder: dict) -> dict:
+        return {
+            "title": folder["title"],
+            "children": [to_request(c) for c in folder["children"] if c["path"] in included]
+        }
+
+    return included, to_request(local_folder)
+
+
+def match_folders(local_folder: dict, remote_folder: dict, included: set) -> tuple:
+    """
+    按名称匹配云端返回的文件夹ID
+    :param local_folder: 本地文件夹结构
+    :param remote_folder: 云端返回的文件夹结构
+    :param included: 本次请求创建的文件夹路径
+    :return: ({文件夹路径: 文件夹ID}, [(云端父文件夹ID, 未创建的本地子文件夹), ...])
+    """
+    folder_ids, deferred = {}, []
+
+    def match(local: dict, remote: dict):
+        folder_ids[local["path"]] = remote["id"]
+        remote_children = {}
+        for child in remote.get("children") or []:
+            remote_children.setdefault(child["title"], []).append(child)
+        for child in local["children"]:
+            if child["path"] not in included:
+                deferred.append((remote["id"], child))
+            elif remote_children.get(child["title"]):
+                match(child, remote_children[child["title"]].pop(0))
+            else:
+                raise ValueError(f"云端未返回文件夹 {child['path']}")
+
+    match(local_folder, remote_folder)
+    return folder_ids, deferred
+
+
+class CowUploader(PackMixin, PartUploadMixin, DedupMixin, VerifyMixin, threading.Thread):
+    path_key = "rel_path"  # 日志与校验报告中的文件路径字段
+    bind_keys = ("origin_url", "object")  # 内容相同的文件绑定时复用的字段
 
     def __init__(self,
                  authorization: str,
@@ -29,7 +163,25 @@ class CowUploader(threading.Thread):
                  message: str = "",
                  valid_days: int = 7,
                  chunk_size: int = 2097152,
-                 threads: int = 5):
+                 threads: int = 5,
+                 pack: str = "",
+                 pack_max_size: int = 1048576,
+                 pack_filter: tuple = (),
+                 pack_level: int = None,
+                 pack_processes: int = None,
+                 session: requests.Session = None,
+                 oss_session: oss2.Session = None,
+                 limiter: threading.Semaphore = None,
+                 progress: bool = True,
+                 tracer: Tracer = None,
+                 endpoints: tuple = (),
+                 endpoint_ttl: int = 600,
+                 processes: int = 0,
+                 adaptive: bool = False,
+                 min_threads: int = 1,
+                 dedup: bool = False,
+                 verify: bool = False,
+                 verify_report: str = ""):
         """
         实例化对象
         :param authorization: 用户 authorization
@@ -41,6 +193,24 @@ class CowUploader(threading.Thread):
         :param valid_days: 传输有效期（单位：天数，默认 7 天）
         :param chunk_size: 分块大小（单位：字节，默认 2097152 字节，即 2 MB）
         :param threads: 上传线程数（默认 5）
+        :param pack: 打包格式（tar.zst 或 zip，默认为空即不打包）
+        :param pack_max_size: 不大于此大小的文件打包上传（单位：字节，默认 1048576 字节，即 1 MB）
+        :param pack_filter: 打包的文件名通配规则，以 ! 开头表示不打包（默认为空）
+        :param pack_level: 压缩级别（默认 tar.zst 为 3，zip 为 6）
+        :param pack_processes: 压缩进程数（默认为 CPU 核心数）
+        :param session: 复用的 requests 会话（默认新建且不保持连接）
+        :param oss_session: 复用的 oss2 会话（默认新建）
+        :param limiter: 分片并发配额，可在多个上传间共享（默认为 threads）
+        :param progress: 是否显示进度条（默认显示）
+        :param tracer: 记录各阶段耗时的追踪器（默认不记录）
+        :param endpoints: 候选访问域名，指定后上传前测速并选择最快的域名（默认使用令牌返回的域名）
+        :param endpoint_ttl: 测速结果缓存有效期（单位：秒，默认 600）
+        :param processes: 上传进程数，大于 0 时由多个进程各自连接上传分片，同时上传的分片数为 min(processes, threads 或 limiter)（默认 0，即仅使用线程）
+        :param adaptive: 是否自适应调整并发（加性增、乘性减），此时 threads 为并发上限，不能与 limiter 同时指定（默认否）
+        :param min_threads: 自适应模式的并发下限（默认 1）
+        :param dedup: 是否去重，内容相同的文件仅上传一次（默认否）
+        :param verify: 是否在完成传输前校验已上传对象的大小与 etag，并重新上传校验失败的文件（默认否）
+        :param verify_report: 校验报告（JSON）写入路径（默认不写入）
         """
         super(CowUploader, self).__init__()
 
@@ -54,23 +224,51 @@ class CowUploader(threading.Thread):
         self.valid_days = valid_days
         self.chunk_size = chunk_size
         self.threads = threads
+        self.pack = pack
+        self.pack_max_size = pack_max_size
+        self.pack_filter = pack_filter
+        self.pack_level = pack_level
+        self.pack_processes = pack_processes
+        self.progress = progress
+        self.processes = processes
+        self.dedup = dedup
+        self.verify = verify
+        self.verify_report = verify_report
 
         # 信息
         self.err = ""
         self.status = "work"
         self.file_dict = {}
         self.upload_info = {
-            "complete": False
+            "complete": False,
+            "network_time": 0.0
         }
         self.transfer_info = {}
         self.auth_headers = {
             "cookie": f"{self.remember_mev2}; cow-auth-token={self.authorization}",
             "authorization": self.authorization,
-            "Connection": "close"
+            "Connection": "close" if session is None else "keep-alive"
         }
 
         # 对象
+        self.session = session or requests.Session()
+        self.oss_session = oss_session or oss2.Session()
+        if limiter and adaptive:
+            raise ValueError("adaptive 不能与共享的 limiter 同时指定")
+        self.limiter = limiter or (AdaptiveLimiter(min_threads, threads) if adaptive else threading.BoundedSemaphore(threads))
+        self.adaptive = isinstance(self.limiter, AdaptiveLimiter)
+        self.tracer = tracer or NULL_TRACER
+        self.endpoint_selector = EndpointSelector(endpoints, chunk_size, endpoint_ttl) if endpoints else None
+        self.lock = threading.Lock()
         self.executor = None
+        self.data_plane = None
+        self.folder_executor = None
+        self.folder_cond = threading.Condition()
+        self.folder_files = {}  # 相对目录 -> [文件信息, ...]
+        self.folder_ready = collections.deque()  # 按创建完成顺序排列的相对目录
+        self.folder_pending = 0
+        self.folder_err = ""
+        self.duplicates = {}  # 文件ID -> [内容相同的其余文件ID, ...]
         self.progress_bar_curr = None
         self.progress_bar_total = None
 
@@ -123,11 +321,16 @@ class CowUploader(threading.Thread):
             ("获取专属域名", self.get_subdomain),
             ("初始化传输", self.init_transfer),
             ("初始化文件夹分片", self.init_folders),
+            ("打包文件", self.init_pack),
+            ("文件去重", self.init_dedup),
             ("上传文件", self.upload_file),
+            ("校验文件", self.verify_files),
             ("完成上传", self.finish),
         ]:
             log(f"{step}……")
-            if not func():
+            with self.tracer.span(func.__name__):
+                succeed = func()
+            if not succeed:
                 print(step, self.err)
                 return False
             if not self.action():
@@ -151,9 +354,11 @@ class CowUploader(threading.Thread):
 
     def get_subdomain(self):
         """获取专属域名"""
+        if self.upload_info.get("url_prefix"):
+            return True  # 已由调用方预置
         try:
             req_url = "https://cowtransfer.com/api/generic/v3/initial"
-            resp = requests.get(url=req_url, headers=self.auth_headers)
+            resp = self.session.get(url=req_url, headers=self.auth_headers)
             sub_domain = resp.json()["account"]["subDomain"]
             if not sub_domain:
                 self.upload_info["url_prefix"] = f"https://cowtransfer.com/s/"
@@ -176,7 +381,7 @@ class CowUploader(threading.Thread):
                 "enablePreview": True,  # 允许预览
                 "enableSaveTo": True  # 允许转存
             }
-            req_resp = requests.post(url=req_url, headers=self.auth_headers, json=req_json)
+            req_resp = self.session.post(url=req_url, headers=self.auth_headers, json=req_json)
             resp_json = req_resp.json()
             if "code" in resp_json and resp_json["code"] == "0000":
                 self.transfer_info.update(resp_json["data"])
@@ -197,92 +402,24 @@ class CowUploader(threading.Thread):
             self.err = "错误：待上传文件或目录不存在"
             return False
 
-        # 判断上传目标类型
-        if os.path.isfile(self.upload_path):
-            # 单文件
-            self.upload_info["mode"] = "single"
-            self.file_dict["1"] = {
-                "file_name": os.path.basename(self.upload_path),
-                "file_format": os.path.basename(self.upload_path).split(".")[-1] if "." in os.path.basename(self.upload_path) else "unknow",
-                "rel_path": "\\" + os.path.basename(self.upload_path),
-                "abs_path": os.path.abspath(self.upload_path),
-                "file_size": os.path.getsize(self.upload_path),
-                "folder_id": "0",
-                "uploaded": False,
-                "uploaded_size": 0
-            }
-        else:
-            # 目录，判断是否含有子文件夹
-            self.upload_info["mode"] = "multiple"
-            if any(map(lambda e: os.path.isdir(os.path.join(self.upload_path, e)), os.listdir(self.upload_path))):
-                self.upload_info["mode"] = "folders"
-
-            # 遍历获取所有待上传文件信息
-            root_path = os.path.abspath(self.upload_path)
-            for root, dirs, files in os.walk(self.upload_path):
-                for file in files:
-                    self.file_dict[str(len(self.file_dict) + 1)] = {
-                        "file_name": os.path.basename(file),
-                        "file_format": os.path.basename(file).split(".")[-1] if "." in os.path.basename(file) else "unknow",
-                        "rel_path": os.path.abspath(os.path.join(root, file)).replace(root_path, ""),
-                        "abs_path": os.path.abspath(os.path.join(root, file)),
-                        "file_size": os.path.getsize(os.path.join(root, file)),
-                        "folder_id": "0",
-                        "uploaded": False,
-                        "uploaded_size": 0
-                    }
+        # 获取待上传文件信息
+        self.upload_info["mode"], file_dict = scan_files(self.upload_path)
+        self.file_dict.update(file_dict)
+        for file_info in self.file_dict.values():
+            if "folder_path" in file_info:
+                self.folder_files.setdefault(file_info["folder_path"], []).append(file_info)
 
         # 含有子文件夹，需在云端创建并绑定处理
         if self.upload_info["mode"] == "folders":
 
             try:
                 # 获取本地文件夹结构
-                def get_children(parent_path: str):
-                    """获取子文件夹"""
-                    children_list = []
-                    for child in os.listdir(parent_path):
-                        if not os.path.isdir(os.path.join(parent_path, child)):
-                            continue
-                        children_list.append({
-                            "title": child,
-                            "children": get_children(str(os.path.join(parent_path, child)))
-                        })
-                    return children_list
-
-                local_folder_structure = {
-                    "folder": {
-                        "title": self.folder_name or os.path.basename(os.path.split(self.upload_path)[0]),
-                        "children": get_children(self.upload_path)
-                    },
-                    "handle_conflict": True
-                }
-
-                # 请求创建文件夹
-                req_url = "https://cowtransfer.com/core/api/dam/folders/0/dfs"
-                req_data = local_folder_structure
-                req_resp = requests.post(url=req_url, headers=self.auth_headers, json=req_data)
-                resp_json = req_resp.json()
-
-                # 根文件夹ID
-                self.upload_info["folder_id"] = resp_json["id"]
-
-                # 获取文件夹ID
-                folder_id_dict = {}
-
-                def get_folder_id(parent_path: str, local_data: list, remote_data: list):
-                    """获取文件夹ID"""
-                    for local, remote in zip(local_data, remote_data):
-                        folder_id_dict[f"{parent_path}\\{local['title']}"] = remote["id"]
-                        if local["children"]:
-                            get_folder_id(f"{parent_path}\\{local['title']}", local["children"], remote["children"])
-
-                get_folder_id("", [local_folder_structure["folder"]], [resp_json])
-
-                # 绑定文件夹ID
-                for folder_path, folder_id in folder_id_dict.items():
-                    for file_id, file_info in self.file_dict.items():
-                        if folder_path.replace(f"\\{self.folder_name}", "") in file_info["abs_path"].replace("/", "\\"):
-                            self.file_dict[file_id]["folder_id"] = folder_id
+                local_folder = local_folders(self.upload_path, self.folder_name)
+
+                # 创建根文件夹及首批子文件夹，其余子树在后台并发创建
+                self.folder_executor = ThreadPoolExecutor(max_workers=self.threads)
+                self.folder_pending = 1
+                self.upload_info["folder_id"] = self.create_folders("0", local_folder)
 
             except Exception as exc:
                 self.err = f"异常：{exc}"
@@ -290,6 +427,106 @@ class CowUploader(threading.Thread):
 
         return True
 
+    def create_folders(self, parent_id: str, local_folder: dict) -> str:
+        """
+        在云端创建文件夹子树（单次请求不超过 FOLDER_BATCH_SIZE 个文件夹），超出部分提交至后台继续创建
+        :param parent_id: 云端父文件夹ID
+        :param local_folder: 本地文件夹结构 {"title", "path", "children"}
+        :return: 子树根文件夹ID
+        """
+        try:
+            # 按广度优先截取子树
+            included, req_folder = folder_batch(local_folder)
+
+            req_url = f"https://cowtransfer.com/core/api/dam/folders/{parent_id}/dfs"
+            req_json = {"folder": req_folder, "handle_conflict": True}
+            with self.tracer.span("create_folders", parent=parent_id, folders=len(included)):
+                resp_json = self.session.post(url=req_url, headers=self.auth_headers, json=req_json).json()
+
+            # 按名称匹配云端返回的文件夹ID，未创建的子文件夹提交至后台
+            folder_ids, deferred = match_folders(local_folder, resp_json, included)
+            for folder_path, folder_id in folder_ids.items():
+                self.register_folder(folder_path, folder_id)
+            for folder_id, child in deferred:
+                self.submit_folders(folder_id, child)
+            return resp_json["id"]
+        except Exception as exc:
+            with self.folder_cond:
+                self.folder_err = self.folder_err or f"异常：创建文件夹 {local_folder['path'] or local_folder['title']} 失败 {exc}"
+            raise
+        finally:
+            with self.folder_cond:
+                self.folder_pending -= 1
+                self.folder_cond.notify_all()
+
+    def submit_folders(self, parent_id: str, local_folder: dict):
+        """提交子树至后台创建"""
+        with self.folder_cond:
+            self.folder_pending += 1
+        self.folder_executor.submit(self.create_folders, parent_id, local_folder)
+
+    def register_folder(self, folder_path: str, folder_id: str):
+        """记录文件夹ID并绑定至其中的文件"""
+        with self.folder_cond:
+            for file_info in self.folder_files.get(folder_path, []):
+                file_info["folder_id"] = folder_id
+            self.folder_ready.append(folder_path)
+            self.folder_cond.notify_all()
+
+    def wait_folder(self, file_info: dict) -> bool:
+        """等待文件所在文件夹创建完成"""
+        with self.folder_cond:
+            while file_info["folder_id"] is None and self.folder_pending and not self.folder_err:
+                self.folder_cond.wait(1)
+        if file_info["folder_id"] is None:
+            self.err = self.folder_err or f"错误：文件夹 {file_info.get('folder_path')} 未创建"
+            return False
+        return True
+
+    def wait_folders(self) -> bool:
+        """等待全部文件夹创建完成"""
+        if not self.folder_executor:
+            return True
+        with self.folder_cond:
+            while self.folder_pending and not self.folder_err:
+                self.folder_cond.wait(1)
+        self.folder_executor.shutdown()
+        if self.folder_err:
+            self.err = self.folder_err
+            return False
+        return True
+
+    def upload_order(self):
+        """上传顺序：所在文件夹已创建的文件优先"""
+        if self.upload_info["mode"] != "folders":
+            yield from self.file_dict.items()
+            return
+        groups = collections.OrderedDict()
+        for file_id, file_info in self.file_dict.items():
+            groups.setdefault(file_info.get("folder_path", ""), []).append((file_id, file_info))
+        while groups:
+            folder_path = None
+            with self.folder_cond:
+                while self.folder_ready and folder_path not in groups:
+                    folder_path = self.folder_ready.popleft()
+            if folder_path not in groups:
+                folder_path = next(iter(groups))  # 尚未创建，上传后再等待绑定
+            yield from groups.pop(folder_path)
+
+    def pack_file(self, size: int) -> tuple:
+        """打包文件的文件信息"""
+        pack_name = f"{self.title or os.path.basename(os.path.abspath(self.upload_path))}.{self.pack}"
+        return str(len(self.file_dict) + 1), {
+            "file_name": pack_name,
+            "file_format": pack_name.split(".")[-1],
+            "rel_path": "\\" + pack_name,
+            "abs_path": "",
+            "file_size": size,
+            "folder_id": self.upload_info.get("folder_id", "0"),
+            "uploaded": False,
+            "uploaded_size": 0
+        }
+
     # 上传文件
     def upload_file(self):
         """上传文件"""
@@ -297,101 +534,152 @@ class CowUploader(threading.Thread):
         # 进度条
         self.progress_bar_total = tqdm(
             total=sum([f["file_size"] for f in self.file_dict.values()]),
-            desc="进度", mininterval=0.1, unit="B", unit_scale=True, unit_divisor=1024
+            desc="进度", mininterval=0.1, unit="B", unit_scale=True, unit_divisor=1024,
+            disable=not self.progress
         )
         self.progress_bar_curr = tqdm(
             total=1, desc=f"当前", mininterval=0.1,
-            unit="B", unit_scale=True, unit_divisor=1024
+            unit="B", unit_scale=True, unit_divisor=1024, disable=not self.progress
         )
 
         # 遍历上传
-        for file_id, file_info in self.file_dict.items():
-            if not self.action():
-                return False
-            log(f"开始上传：{file_info['rel_path']}……")
-            self.progress_bar_curr.reset(file_info["file_size"])
-            self.progress_bar_curr.set_description(f"当前 {file_info['rel_path']}")
-            self.progress_bar_total.set_description(f"进度 {file_id}/{len(self.file_dict)}")
+        if self.processes:
+            self.data_plane = ProcessDataPlane(self.processes)
+        try:
+            for index, (file_id, file_info) in enumerate(self.upload_order(), 1):
+                if not self.action():
+                    return False
+                if "dedup_of" in file_info:
+                    continue  # 随原文件绑定
+                self.progress_bar_total.set_description(f"进度 {index}/{len(self.file_dict)}")
+                try:
+                    with self.tracer.span("file", path=file_info["rel_path"], size=file_info["file_size"]):
+                        succeed = self.upload_one(file_id, file_info)
+                except Exception as exc:
+                    self.err, succeed = f"异常：{exc}", False
+                if not succeed:
+                    # 校验模式下记录错误并继续，待校验阶段重新上传
+                    if not self.verify or self.status == "cancel":
+                        return False
+                    file_info["error"] = self.err
+                    log(f"上传失败：{file_info['rel_path']} {self.err}")
+        finally:
+            if self.data_plane:
+                self.data_plane.close()
+                self.data_plane = None
 
-            # 获取凭证
-            req_url = "https://cowtransfer.com/core/api/filems/front/upload/tokens"
-            req_json = {
-                "file_format": file_info["file_format"]
-            }
-            req_resp = requests.post(url=req_url, headers=self.auth_headers, json=req_json)
+        self.close_progress_bar()
+        self.summarize_pack()
+        return True
+
+    def upload_one(self, file_id: str, file_info: dict) -> bool:
+        """上传单个文件"""
+        log(f"开始上传：{file_info['rel_path']}……")
+        self.progress_bar_curr.reset(file_info["file_size"])
+        self.progress_bar_curr.set_description(f"当前 {file_info['rel_path']}")
+
+        # 获取凭证
+        req_url = "https://cowtransfer.com/core/api/filems/front/upload/tokens"
+        req_json = {
+            "file_format": file_info["file_format"]
+        }
+        with self.tracer.span("upload_tokens"):
+            req_resp = self.session.post(url=req_url, headers=self.auth_headers, json=req_json)
             resp_json = req_resp.json()
 
-            # 初始化 bucket 对象
-            bucket = oss2.Bucket(
-                auth=oss2.StsAuth(
-                    access_key_id=resp_json["access_key_id"],
-                    access_key_secret=resp_json["access_key_secret"],
-                    security_token=resp_json["security_token"]
-                ),
-                endpoint=resp_json["endpoint"],
-                bucket_name=resp_json["bucket_name"],
-                enable_crc=False  # 开启后因校验占用大量资源而可能会导致上传速度严重下降
-            )
-
-            # 上传分片
-            def upload_part(part_num, part_data):
-                """上传分片"""
-                if not self.action():
-                    return False
-                upload_result = bucket.upload_part(
-                    upl_path, upload_id, part_num, part_data
+        # 初始化 bucket 对象
+        auth = oss2.StsAuth(
+            access_key_id=resp_json["access_key_id"],
+            access_key_secret=resp_json["access_key_secret"],
+            security_token=resp_json["security_token"]
+        )
+        bucket_name, buckets = resp_json["bucket_name"], {}
+
+        def get_bucket(endpoint: str) -> oss2.Bucket:
+            """按访问域名获取 bucket 对象"""
+            if endpoint not in buckets:
+                buckets[endpoint] = oss2.Bucket(
+                    auth=auth,
+                    endpoint=endpoint,
+                    bucket_name=bucket_name,
+                    session=self.oss_session,
+                    enable_crc=False  # 开启后因校验占用大量资源而可能会导致上传速度严重下降
                 )
-                self.progress_bar_total.update(len(part_data))
-                self.progress_bar_curr.update(len(part_data))
-                self.file_dict[file_id]["uploaded_size"] += len(part_data)
-                parts.append(PartInfo(part_num, upload_result.etag))
-                return True
-
-            # 提交上传
-            upl_path = resp_json["object_name"]
+            return buckets[endpoint]
+
+        # 选择访问域名
+        endpoint = resp_json["endpoint"]
+        if self.endpoint_selector:
+            with self.tracer.span("probe_endpoints"):
+                endpoint = self.endpoint_selector.choose(bucket_name, endpoint, get_bucket, resp_json["object_name"])
+        bucket = get_bucket(endpoint)
+
+        # 提交上传
+        upl_path = resp_json["object_name"]
+        with self.tracer.span("init_multipart_upload"):
             upload_id = bucket.init_multipart_upload(upl_path).upload_id
-            parts = []
-            chunk_id, task_list = 0, []
-            self.executor = ThreadPoolExecutor(max_workers=self.threads)
-            with open(file_info["abs_path"], "rb") as f:
-                while True:
-                    if not self.action():
-                        return False
-                    chunk_id += 1
-                    chunk_bytes = f.read(self.chunk_size)
-                    if len(chunk_bytes) != 0:
-                        task_list.append(self.executor.submit(upload_part, chunk_id, chunk_bytes))
-                        while [task.done() for task in task_list].count(False) > self.threads * 2:
-                            time.sleep(0.1)
-                        continue
-                    self.executor.shutdown()
-                    break
-            bucket.complete_multipart_upload(upl_path, upload_id, parts)
-
-            # 绑定文件
-            bind_url = "https://cowtransfer.com/core/api/dam/asset/files"
-            bind_data = {
-                "folder_id": file_info["folder_id"],
-                "file_md5": "",
-                "file_sha1": "",
-                "second_transmission": False,
-                "file_info": {
-                    "origin_url": f"{resp_json['host']}/{resp_json['object_name']}",
-                    "size": file_info["file_size"],
-                    "title": file_info["file_name"]
-                }
+        parts = self.upload_parts(
+            file_id, file_info, get_bucket, bucket_name, endpoint, upl_path, upload_id,
+            (resp_json["access_key_id"], resp_json["access_key_secret"], resp_json["security_token"])
+        )
+        if parts is None:
+            return False
+        complete_result, parts_checked = self.complete_checked(bucket, upl_path, upload_id, parts, file_info)
+        if complete_result is None:
+            return False
+
+        # 打包文件以压缩后大小绑定
+        if "packer" in file_info:
+            file_info["file_size"] = file_info["packer"].packed_size
+        file_info["object"] = {
+            "bucket": bucket,
+            "key": upl_path,
+            "size": file_info["file_size"],
+            "etag": complete_result.etag,
+            "parts_checked": parts_checked
+        }
+
+        # 绑定文件，内容相同的文件复用同一对象
+        file_info["origin_url"] = f"{resp_json['host']}/{resp_json['object_name']}"
+        if not self.bind_file(file_info):
+            return False
+        return self.bind_duplicates(file_id)
+
+    def bind_file(self, file_info: dict) -> bool:
+        """绑定文件"""
+        if not self.wait_folder(file_info):
+            return False
+        bind_url = "https://cowtransfer.com/core/api/dam/asset/files"
+        bind_data = {
+            "folder_id": file_info["folder_id"],
+            "file_md5": "",
+            "file_sha1": "",
+            "second_transmission": False,
+            "file_info": {
+                "origin_url": file_info["origin_url"],
+                "size": file_info["file_size"],
+                "title": file_info["file_name"]
             }
-            resp = requests.post(url=bind_url, headers=self.auth_headers, json=bind_data)
+        }
+        with self.tracer.span("bind"):
+            resp = self.session.post(url=bind_url, headers=self.auth_headers, json=bind_data)
             resp_json = resp.json()
-            self.file_dict[file_id]["content_id"] = resp_json["content_id"]
-            self.file_dict[file_id]["uploaded"] = True
-            log(f"上传完成：{file_info['rel_path']}")
-
-        self.close_progress_bar()
+        if "content_id" not in resp_json:
+            self.err = f"绑定文件 {file_info['rel_path']} 失败：{resp_json}"
+            return False
+        file_info["content_id"] = resp_json["content_id"]
+        file_info["uploaded"] = True
+        log(f"上传完成：{file_info['rel_path']}")
         return True
 
+    def is_bound(self, file_info: dict) -> bool:
+        """文件是否已绑定（完成时需要 content_id）"""
+        return bool(file_info.get("uploaded")) and "content_id" in file_info
+
     def finish(self):
         """完成传输"""
+        if not self.wait_folders():
+            return False
         req_url = "https://cowtransfer.com/core/api/transfer/uploaded"
         if self.upload_info["mode"] in ["single", "multiple"]:
             req_json = {
@@ -408,7 +696,7 @@ class CowUploader(threading.Thread):
         else:
             self.err = "错误：未定义的上传模式"
             return False
-        requests.post(url=req_url, headers=self.auth_headers, json=req_json)
+        self.session.post(url=req_url, headers=self.auth_headers, json=req_json)
         self.upload_info["complete"] = True
         return True
 
@@ -0,0 +1,113 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+# 快速比对时读取文件首尾各此大小的数据
+SAMPLE_SIZE = 65536
+
+debug = False
+
+
+def log(text: str) -> str:
+    if debug:
+        print(text)
+    return text
+
+
+def file_digest(path: str, size: int, sample: bool = False) -> str:
+    """
+    文件摘要
+    :param path: 文件路径
+    :param size: 文件大小
+    :param sample: 仅读取首尾各 SAMPLE_SIZE 字节（文件不大于 2 * SAMPLE_SIZE 时与完整摘要等价）
+    """
+    digest = hashlib.blake2b()
+    with open(path, "rb") as f:
+        if sample and size > SAMPLE_SIZE * 2:
+            digest.update(f.read(SAMPLE_SIZE))
+            f.seek(size - SAMPLE_SIZE)
+            digest.update(f.read(SAMPLE_SIZE))
+        else:
+            while True:
+                chunk = f.read(1048576)
+                if not chunk:
+                    break
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def find_duplicates(file_dict: dict, threads: int = 4) -> dict:
+    """
+    查找内容相同的文件：先按大小分组，再按首尾采样摘要、完整摘要逐步细分
+    :param file_dict: 待上传文件信息（跳过打包文件与空文件）
+    :param threads: 计算摘要的线程数
+    :return: {首个文件ID: [内容相同的其余文件ID, ...]}
+    """
+    groups = {}
+    for file_id, file_info in file_dict.items():
+        if file_info.get("abs_path") and file_info["file_size"] > 0 and "packer" not in file_info:
+            groups.setdefault(file_info["file_size"], []).append(file_id)
+    candidates = [ids for ids in groups.values() if len(ids) > 1]
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for sample in [True, False]:
+            file_ids = [file_id for ids in candidates for file_id in ids
+                        if sample or file_dict[file_id]["file_size"] > SAMPLE_SIZE * 2]
+            digests = dict(zip(file_ids, executor.map(
+                lambda file_id: file_digest(file_dict[file_id]["abs_path"], file_dict[file_id]["file_size"], sample),
+                file_ids
+            )))
+            refined = []
+            for ids in candidates:
+                if not sample and ids[0] not in digests:
+                    refined.append(ids)  # 采样已覆盖全部内容
+                    continue
+                groups = {}
+                for file_id in ids:
+                    groups.setdefault(digests[file_id], []).append(file_id)
+                refined.extend(group for group in groups.values() if len(group) > 1)
+            candidates = refined
+
+    return {ids[0]: ids[1:] for ids in candidates}
+
+
+class DedupMixin:
+    """
+    上传类的去重步骤，子类需提供 dedup、threads、file_dict、upload_info、duplicates、progress_bar_total 与 bind_file
+    bind_keys 为内容相同的文件绑定时从原文件复用的字段
+    """
+    bind_keys = ("object",)
+
+    def init_dedup(self):
+        """文件去重"""
+        if not self.dedup:
+            return True
+        try:
+            self.duplicates = find_duplicates(self.file_dict, self.threads)
+        except OSError as exc:
+            self.err = f"异常：{exc}"
+            return False
+        for file_id, dup_ids in self.duplicates.items():
+            for dup_id in dup_ids:
+                self.file_dict[dup_id]["dedup_of"] = file_id
+        self.upload_info["dedup"] = {
+            "files": sum(len(dup_ids) for dup_ids in self.duplicates.values()),  # 免上传文件数
+            "saved_size": sum(self.file_dict[file_id]["file_size"] * len(dup_ids)
+                              for file_id, dup_ids in self.duplicates.items())  # 节省上传字节数
+        }
+        log(f"文件去重：{self.upload_info['dedup']['files']} 个文件无需上传")
+        return True
+
+    def bind_duplicates(self, file_id) -> bool:
+        """以原文件已上传的对象绑定内容相同的文件"""
+        file_info = self.file_dict[file_id]
+        for dup_id in self.duplicates.get(file_id, []):
+            dup_info = self.file_dict[dup_id]
+            if dup_info.get("uploaded"):
+                continue
+            for key in self.bind_keys:
+                dup_info[key] = file_info[key]
+            if not self.bind_file(dup_info):
+                return False
+            dup_info["uploaded_size"] = dup_info["file_size"]
+            self.progress_bar_total.update(dup_info["file_size"])
+        return True
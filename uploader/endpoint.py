@@ -0,0 +1,144 @@
+import os
+import time
+import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+debug = False
+
+
+def log(text: str) -> str:
+    if debug:
+        print(text)
+    return text
+
+
+# (bucket 名称, 候选访问域名) -> {"ranking": [测速结果, ...], "expire": 过期时间}，同一进程内的上传共享
+ENDPOINT_CACHE = {}
+CACHE_LOCK = threading.Lock()
+
+
+def probe(bucket, key: str, burst_size: int = 262144, samples: int = 3) -> dict:
+    """
+    测量访问域名的往返时延与短时上传吞吐
+    :param bucket: 使用该访问域名的 oss2.Bucket 对象
+    :param key: 用于测速的对象名（仅初始化分片上传，测速后取消，不会生成对象）
+    :param burst_size: 测速上传的数据量（单位：字节，默认 256 KB）
+    :param samples: 往返时延采样次数，取最小值
+    :return: {"endpoint", "rtt", "throughput"}，失败时 rtt 与 throughput 为 None
+    """
+    result = {"endpoint": bucket.endpoint, "rtt": None, "throughput": None}
+    try:
+        with requests.Session() as session:
+            rtts = []
+            for _ in range(samples):
+                start = time.time()
+                session.head(bucket.endpoint.replace("://", f"://{bucket.bucket_name}.", 1), timeout=5)
+                rtts.append(time.time() - start)
+        upload_id = bucket.init_multipart_upload(key).upload_id
+        try:
+            start = time.time()
+            bucket.upload_part(key, upload_id, 1, os.urandom(burst_size))
+            elapsed = time.time() - start
+        finally:
+            bucket.abort_multipart_upload(key, upload_id)
+        result["rtt"] = min(rtts)
+        result["throughput"] = burst_size / max(elapsed - result["rtt"], 1e-3)
+    except Exception as exc:
+        log(f"测速失败：{bucket.endpoint} {exc}")
+    return result
+
+
+def expected_time(result: dict, size: int) -> float:
+    """按测速结果估算上传 size 字节的耗时"""
+    if result["rtt"] is None:
+        return float("inf")
+    return result["rtt"] + size / result["throughput"]
+
+
+class EndpointSelector:
+
+    def __init__(self,
+                 candidates: list,
+                 chunk_size: int = 2097152,
+                 ttl: int = 600,
+                 burst_size: int = 262144,
+                 slowdown: float = 3.0,
+                 min_samples: int = 5):
+        """
+        测速并选择最快的访问域名，上传中分片耗时明显变差时切换至次优域名
+        :param candidates: 候选访问域名（令牌返回的域名总会参与测速）
+        :param chunk_size: 分块大小，用于估算各域名的分片耗时
+        :param ttl: 测速结果缓存有效期（单位：秒，默认 600）
+        :param burst_size: 测速上传的数据量（单位：字节，默认 256 KB）
+        :param slowdown: 分片耗时超过测速估算值的倍数（滑动平均）时切换域名（默认 3 倍）
+        :param min_samples: 判定变差前至少需要的分片数（默认 5）
+        """
+        self.candidates = list(candidates)
+        self.chunk_size = chunk_size
+        self.ttl = ttl
+        self.burst_size = burst_size
+        self.slowdown = slowdown
+        self.min_samples = min_samples
+
+        self.lock = threading.Lock()
+        self.cache_keys = {}  # bucket 名称 -> 缓存键
+        self.stats = {}  # (bucket 名称, 访问域名) -> [分片数, 耗时比滑动平均]
+
+    def choose(self, bucket_name: str, default_endpoint: str, get_bucket, key: str) -> str:
+        """
+        选择访问域名（优先使用缓存）
+        :param bucket_name: bucket 名称
+        :param default_endpoint: 令牌返回的访问域名
+        :param get_bucket: 根据访问域名返回 oss2.Bucket 对象的函数
+        :param key: 用于测速的对象名
+        :return: 访问域名
+        """
+        endpoints = list(dict.fromkeys([default_endpoint] + self.candidates))
+        cache_key = self.cache_keys[bucket_name] = (bucket_name, tuple(sorted(endpoints)))
+        with CACHE_LOCK:
+            cache = ENDPOINT_CACHE.get(cache_key)
+            if cache and cache["expire"] > time.time():
+                return cache["ranking"][0]["endpoint"]
+
+        with ThreadPoolExecutor(max_workers=len(endpoints)) as executor:
+            results = list(executor.map(
+                lambda endpoint: dict(probe(get_bucket(endpoint), key, self.burst_size), endpoint=endpoint), endpoints
+            ))
+        ranking = sorted([r for r in results if r["rtt"] is not None],
+                         key=lambda r: expected_time(r, self.chunk_size))
+        if not ranking:
+            ranking = [{"endpoint": default_endpoint, "rtt": None, "throughput": None}]
+        for r in ranking:
+            log(f"测速：{r['endpoint']} 时延 {r['rtt']} 秒，吞吐 {r['throughput']} 字节/秒")
+        with CACHE_LOCK:
+            ENDPOINT_CACHE[cache_key] = {"ranking": ranking, "expire": time.time() + self.ttl}
+        return ranking[0]["endpoint"]
+
+    def current(self, bucket_name: str, default_endpoint: str) -> str:
+        """当前使用的访问域名"""
+        cache = ENDPOINT_CACHE.get(self.cache_keys.get(bucket_name))
+        return cache["ranking"][0]["endpoint"] if cache else default_endpoint
+
+    def record(self, bucket_name: str, endpoint: str, seconds: float, size: int):
+        """记录分片耗时，变差时切换至次优域名"""
+        cache = ENDPOINT_CACHE.get(self.cache_keys.get(bucket_name))
+        if not cache:
+            return
+        result = next((r for r in cache["ranking"] if r["endpoint"] == endpoint), None)
+        if result is None or result["rtt"] is None:
+            return
+        with self.lock:
+            stat = self.stats.setdefault((bucket_name, endpoint), [0, 1.0])
+            stat[0] += 1
+            stat[1] = stat[1] * 0.8 + seconds / expected_time(result, size) * 0.2
+            degraded = stat[0] >= self.min_samples and stat[1] > self.slowdown
+        if not degraded:
+            return
+        with CACHE_LOCK:
+            ranking = cache["ranking"]
+            if len(ranking) > 1 and ranking[0]["endpoint"] == endpoint:
+                ranking.append(ranking.pop(0))
+                log(f"访问域名 {endpoint} 分片耗时为估算值的 {stat[1]:.1f} 倍，切换至 {ranking[0]['endpoint']}")
+        with self.lock:
+            self.stats.pop((bucket_name, endpoint), None)
@@ -0,0 +1,112 @@
+import os
+import mmap
+import time
+import oss2
+import collections
+import multiprocessing
+from oss2.models import PartInfo
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from .adaptive import is_throttled
+
+# 工作进程内按凭证缓存的 bucket 对象（各进程独立的连接池）
+worker_buckets = {}
+
+
+def upload_part(auth_args: tuple, endpoint: str, bucket_name: str, key: str, upload_id: str,
+                path: str, chunk_size: int, part_num: int) -> dict:
+    """
+    在工作进程中上传一个分片（通过内存映射读取源文件）
+    :return: {"part_num", "endpoint", "etag", "size", "start", "end", "pid", "error", "throttled"}，时间为 time.time()
+    """
+    bucket_key = (auth_args, endpoint, bucket_name)
+    if bucket_key not in worker_buckets:
+        worker_buckets.clear()
+        worker_buckets[bucket_key] = oss2.Bucket(
+            auth=oss2.StsAuth(*auth_args),
+            endpoint=endpoint,
+            bucket_name=bucket_name,
+            enable_crc=False  # 开启后因校验占用大量资源而可能会导致上传速度严重下降
+        )
+    bucket = worker_buckets[bucket_key]
+    offset = (part_num - 1) * chunk_size
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        data = mm[offset:offset + chunk_size]
+    result = {"part_num": part_num, "endpoint": endpoint, "etag": "", "size": len(data), "pid": os.getpid(), "error": "", "throttled": False}
+    result["start"] = time.time()
+    try:
+        result["etag"] = bucket.upload_part(key, upload_id, part_num, data).etag
+    except Exception as exc:
+        # 异常对象未必可序列化，仅返回描述与是否可重试
+        result["error"], result["throttled"] = f"分片 {part_num} 上传失败：{exc}", is_throttled(exc)
+    result["end"] = time.time()
+    return result
+
+
+class ProcessDataPlane:
+
+    def __init__(self, processes: int):
+        """
+        多进程分片上传
+        同时上传的分片数不超过 processes，且每个分片提交前需获取上传对象的分片并发配额（limiter），
+        因此实际并发为 min(processes, 配额)，共享配额与自适应并发对多进程模式同样生效
+        工作进程以 spawn 方式启动，避免在已有线程（进度条、文件夹创建等）的进程中 fork
+        :param processes: 工作进程数
+        """
+        self.processes = processes
+        self.executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+
+    def upload(self, auth_args: tuple, get_endpoint, bucket_name: str, key: str, upload_id: str,
+               path: str, file_size: int, chunk_size: int, limiter, action, on_part, retries: int = 0):
+        """
+        由工作进程上传文件的全部分片
+        :param auth_args: (access_key_id, access_key_secret, security_token)
+        :param get_endpoint: 返回当前访问域名的函数，每个分片提交前调用，上传中可随测速结果切换域名
+        :param limiter: 分片并发配额，每个分片提交前获取、完成后归还
+        :param action: 提交分片前调用，暂停时阻塞，已取消时返回 False
+        :param on_part: 每个分片结束（含失败）后调用，参数为 upload_part 的返回结果
+        :param retries: 限流等可重试错误的重试次数（默认不重试）
+        :return: PartInfo 列表，已取消时返回 None
+        """
+        part_count = -(-file_size // chunk_size)
+        todo = collections.deque((part_num, 0) for part_num in range(1, part_count + 1))
+        running, parts = {}, []
+        try:
+            while todo or running:
+                # 提交分片（暂停时不再提交，并发配额随分片完成归还）
+                while todo and len(running) < self.processes:
+                    if not action():
+                        return None
+                    limiter.acquire()
+                    part_num, attempt = todo.popleft()
+                    try:
+                        future = self.executor.submit(
+                            upload_part, auth_args, get_endpoint(), bucket_name, key, upload_id, path, chunk_size, part_num
+                        )
+                    except BaseException:
+                        limiter.release()
+                        raise
+                    future.add_done_callback(lambda _: limiter.release())
+                    running[future] = (part_num, attempt)
+
+                # 汇总结果
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    part_num, attempt = running.pop(future)
+                    result = future.result()
+                    on_part(result)
+                    if not result["error"]:
+                        parts.append(PartInfo(part_num, result["etag"]))
+                    elif result["throttled"] and attempt < retries:
+                        time.sleep(attempt + 1)
+                        todo.appendleft((part_num, attempt + 1))
+                    else:
+                        raise RuntimeError(result["error"])
+            return parts
+        finally:
+            for future in running:
+                future.cancel()
+            wait(running)
+
+    def close(self):
+        """关闭工作进程"""
+        self.executor.shutdown()
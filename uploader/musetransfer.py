@@ -5,8 +5,14 @@ import time
 import requests
 import threading
 from tqdm import tqdm
-from oss2.models import PartInfo
-from concurrent.futures import ThreadPoolExecutor
+from .packer import PackMixin
+from .trace import NULL_TRACER, Tracer
+from .endpoint import EndpointSelector
+from .mpupload import ProcessDataPlane
+from .adaptive import AdaptiveLimiter
+from .parts import PartUploadMixin
+from .dedup import DedupMixin
+from .verify import VerifyMixin
 
 requests.adapters.DEFAULT_RETRIES = 3
 
@@ -19,7 +25,71 @@ def log(text: str) -> str:
     return text
 
 
-class MuseUploader(threading.Thread):
+def new_file_info(abspath: str, upl_path: str) -> dict:
+    """待上传文件信息"""
+    name = os.path.basename(abspath)
+    return {
+        "abs_path": abspath,
+        "upl_path": upl_path,
+        "file_name": name,
+        "uuid_name": str(uuid.uuid4()).replace("-", "") + ("." + name.split(".")[-1] if name.split(".")[-1] != name else ""),
+        "file_size": os.path.getsize(abspath),
+        "uploaded_size": 0.0,
+        "process": 0
+    }
+
+
+def scan_files(upload_path: str) -> dict:
+    """获取待上传文件信息"""
+
+    # 文件
+    if os.path.isfile(upload_path):
+        abspath = os.path.abspath(upload_path).replace("\\", "/")
+        return {1: new_file_info(abspath, "\\" + os.path.basename(abspath))}
+
+    # 目录
+    file_dict = {}
+    root_path = os.path.abspath(upload_path).replace("\\", "/")
+    for root, dirs, files in os.walk(upload_path):
+        for name in files:
+            abspath = os.path.abspath(os.path.join(root, name)).replace("\\", "/")
+            file_dict[len(file_dict) + 1] = new_file_info(abspath, abspath.replace(root_path, "").strip("/"))
+    return file_dict
+
+
+def check_share(total_size: int, title: str, password: str, expire: int) -> str:
+    """
+    检查分享参数
+    :return: 错误（"错误：" 开头）、警告（"警告：" 开头，标题将截断为 64 位）或空字符串
+    """
+
+    # 总大小
+    if total_size > 10 * 1024 ** 3:
+        return f"错误：待上传文件总大小（{round(total_size / 1024 ** 3, 2)} GB）超过 10 GB"
+
+    # 标题
+    if not title:
+        return "错误：分享链接的标题不能为空"
+
+    # 密码
+    if password:
+        if not password.isdigit():
+            return "错误：密码必须为数字"
+        elif not len(password) == 4:
+            return "错误：密码长度必须为4位"
+
+    # 有效期
+    if expire not in [7, 30, 365]:
+        return "错误：有效期必须为 7, 30, 365 任一"
+
+    if len(title) > 64:
+        return "警告：分享链接的标题长度大于64位，超出部分将被丢弃"
+    return ""
+
+
+class MuseUploader(PackMixin, PartUploadMixin, DedupMixin, VerifyMixin, threading.Thread):
+    path_key = "upl_path"  # 日志与校验报告中的文件路径字段
+    bind_keys = ("path", "etag", "object")  # 内容相同的文件绑定时复用的字段
 
     def __init__(self,
                  client_id: str,
@@ -29,7 +99,25 @@ class MuseUploader(threading.Thread):
                  password: str = "",
                  valid_days: int = 7,
                  chunk_size: int = 2097152,
-                 threads: int = 5):
+                 threads: int = 5,
+                 pack: str = "",
+                 pack_max_size: int = 1048576,
+                 pack_filter: tuple = (),
+                 pack_level: int = None,
+                 pack_processes: int = None,
+                 session: requests.Session = None,
+                 oss_session: oss2.Session = None,
+                 limiter: threading.Semaphore = None,
+                 progress: bool = True,
+                 tracer: Tracer = None,
+                 endpoints: tuple = (),
+                 endpoint_ttl: int = 600,
+                 processes: int = 0,
+                 adaptive: bool = False,
+                 min_threads: int = 1,
+                 dedup: bool = False,
+                 verify: bool = False,
+                 verify_report: str = ""):
         """
         实例化对象
         :param client_id: client_id
@@ -40,6 +128,24 @@ class MuseUploader(threading.Thread):
         :param valid_days: 分享链接的有效期（默认 7 天，可选：7, 30, 365)
         :param chunk_size: 分块大小（单位：字节，默认 2097152 字节，即 2 MB）
         :param threads: 上传线程数（默认 5）
+        :param pack: 打包格式（tar.zst 或 zip，默认为空即不打包）
+        :param pack_max_size: 不大于此大小的文件打包上传（单位：字节，默认 1048576 字节，即 1 MB）
+        :param pack_filter: 打包的文件名通配规则，以 ! 开头表示不打包（默认为空）
+        :param pack_level: 压缩级别（默认 tar.zst 为 3，zip 为 6）
+        :param pack_processes: 压缩进程数（默认为 CPU 核心数）
+        :param session: 复用的 requests 会话（默认新建且不保持连接）
+        :param oss_session: 复用的 oss2 会话（默认新建）
+        :param limiter: 分片并发配额，可在多个上传间共享（默认为 threads）
+        :param progress: 是否显示进度条（默认显示）
+        :param tracer: 记录各阶段耗时的追踪器（默认不记录）
+        :param endpoints: 候选访问域名，指定后上传前测速并选择最快的域名（默认使用令牌返回的域名）
+        :param endpoint_ttl: 测速结果缓存有效期（单位：秒，默认 600）
+        :param processes: 上传进程数，大于 0 时由多个进程各自连接上传分片，同时上传的分片数为 min(processes, threads 或 limiter)（默认 0，即仅使用线程）
+        :param adaptive: 是否自适应调整并发（加性增、乘性减），此时 threads 为并发上限，不能与 limiter 同时指定（默认否）
+        :param min_threads: 自适应模式的并发下限（默认 1）
+        :param dedup: 是否去重，内容相同的文件仅上传一次（默认否）
+        :param verify: 是否在完成传输前校验已上传对象的大小与 etag，并重新上传校验失败的文件（默认否）
+        :param verify_report: 校验报告（JSON）写入路径（默认不写入）
         """
         super(MuseUploader, self).__init__()
 
@@ -52,6 +158,16 @@ class MuseUploader(threading.Thread):
         self.expire = valid_days
         self.chunk_size = chunk_size
         self.threads = threads
+        self.pack = pack
+        self.pack_max_size = pack_max_size
+        self.pack_filter = pack_filter
+        self.pack_level = pack_level
+        self.pack_processes = pack_processes
+        self.progress = progress
+        self.processes = processes
+        self.dedup = dedup
+        self.verify = verify
+        self.verify_report = verify_report
 
         # 信息
         self.err = ""
@@ -59,12 +175,28 @@ class MuseUploader(threading.Thread):
         self.file_dict = {}
         self.auth_headers = {}
         self.upload_info = {
-            "complete": False
+            "complete": False,
+            "network_time": 0.0
         }
         self.transfer_info = {}
 
         # 对象
+        self.session = session or requests.Session()
+        self.oss_session = oss_session or oss2.Session()
+        if limiter and adaptive:
+            raise ValueError("adaptive 不能与共享的 limiter 同时指定")
+        self.limiter = limiter or (AdaptiveLimiter(min_threads, threads) if adaptive else threading.BoundedSemaphore(threads))
+        self.adaptive = isinstance(self.limiter, AdaptiveLimiter)
+        self.tracer = tracer or NULL_TRACER
+        self.endpoint_selector = EndpointSelector(endpoints, chunk_size, endpoint_ttl) if endpoints else None
+        self.keep_alive = session is not None
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.bucket = None
+        self.endpoint = ""
+        self.duplicates = {}  # 文件ID -> [内容相同的其余文件ID, ...]
         self.executor = None
+        self.data_plane = None
         self.progress_bar_curr = None
         self.progress_bar_total = None
 
@@ -117,11 +249,16 @@ class MuseUploader(threading.Thread):
             ("获取访问令牌", self.get_token),
             ("创建分享链接", self.create_share_url),
             ("获取上传令牌", self.get_upload_token),
+            ("打包文件", self.init_pack),
+            ("文件去重", self.init_dedup),
             ("上传文件", self.upload_file),
+            ("校验文件", self.verify_files),
             ("完成上传", self.finish),
         ]:
             log(f"{step}……")
-            if not func():
+            with self.tracer.span(func.__name__):
+                succeed = func()
+            if not succeed:
                 print(step, self.err)
                 return False
             if not self.action():
@@ -141,72 +278,28 @@ class MuseUploader(threading.Thread):
             self.err = "错误：待上传文件或目录不存在"
             return False
         self.get_file_info()
-        total_size = sum(file["file_size"] for file in self.file_dict.values())
-        if total_size > 10 * 1024 ** 3:
-            self.err = f"错误：待上传文件总大小（{round(total_size / 1024 ** 3, 2)} GB）超过 10 GB"
-            return False
 
-        # 标题
-        if not self.title:
-            self.err = "错误：分享链接的标题不能为空"
+        # 总大小、标题、密码与有效期
+        total_size = sum(file["file_size"] for file in self.file_dict.values())
+        self.err = check_share(total_size, self.title, self.password, self.expire)
+        if self.err.startswith("错误"):
             return False
-        if len(self.title) > 64:
-            self.err = "警告：分享链接的标题长度大于64位，超出部分将被丢弃"
-            self.title = self.title[:64]  # official limited
-
-        # 密码
-        if self.password:
-            if not self.password.isdigit():
-                self.err = "错误：密码必须为数字"
-                return False
-            elif not len(self.password) == 4:
-                self.err = "错误：密码长度必须为4位"
-                return False
-
-        # 有效期
-        if self.expire not in [7, 30, 365]:
-            self.err = "错误：有效期必须为 7, 30, 365 任一"
+        self.title = self.title[:64]  # official limited
 
         return True
 
     def get_file_info(self) -> bool:
         """获取待上传文件信息"""
-
-        # 判断上传目标类型
-        if os.path.isfile(self.upload_path):
-            # 文件
-            abspath = os.path.abspath(self.upload_path).replace("\\", "/")
-            filename = os.path.basename(abspath)
-            self.file_dict[1] = {
-                "abs_path": abspath,
-                "upl_path": "\\" + filename,
-                "file_name": filename,
-                "uuid_name": str(uuid.uuid4()).replace("-", "") + "." + filename.split(".")[-1] if filename.split(".")[-1] != filename else "",
-                "file_size": os.path.getsize(abspath),
-                "uploaded_size": 0.0,
-                "process": 0
-            }
-        else:
-            # 目录
-            for root, dirs, files in os.walk(self.upload_path):
-                for name in files:
-                    abspath = os.path.abspath(os.path.join(root, name)).replace("\\", "/")
-                    self.file_dict[len(self.file_dict) + 1] = {
-                        "abs_path": abspath,
-                        "upl_path": abspath.replace(os.path.abspath(self.upload_path).replace("\\", "/"), "").strip("/"),
-                        "file_name": name,
-                        "uuid_name": str(uuid.uuid4()).replace("-", "") + "." + name.split(".")[-1] if name.split(".")[-1] != name else "",
-                        "file_size": os.path.getsize(abspath),
-                        "uploaded_size": 0.0,
-                        "process": 0
-                    }
+        self.file_dict.update(scan_files(self.upload_path))
         return True
 
     def get_token(self):
         """获取访问令牌"""
+        if self.auth_headers:
+            return True  # 已由调用方预置
         try:
             req_url = "https://open-auth.tezign.com/open-api/oauth/get-token"
-            resp = requests.post(url=req_url, json={"clientId": self.client_id, "clientKey": self.client_key})
+            resp = self.session.post(url=req_url, json={"clientId": self.client_id, "clientKey": self.client_key})
             resp_json = resp.json()
             if resp_json.get("code") != "0":
                 self.err = f"请求获取访问令牌失败：{resp_json.get('message', '未知原因')}"
@@ -214,7 +307,7 @@ class MuseUploader(threading.Thread):
             self.auth_headers = {
                 "Access-token": resp_json["result"]["access_token"],
                 "Token-type": resp_json["result"]["token_type"],
-                "Connection": "close"
+                "Connection": "keep-alive" if self.keep_alive else "close"
             }
             return True
         except Exception as exc:
@@ -231,7 +324,7 @@ class MuseUploader(threading.Thread):
                     "expire": self.expire
                 }
             }
-            resp = requests.post(url=req_url, json=req_body, headers=self.auth_headers)
+            resp = self.session.post(url=req_url, json=req_body, headers=self.auth_headers)
             resp_json = resp.json()
             if resp_json.get("code") != "0":
                 self.err = f"请求创建分享链接失败：{resp_json.get('message', '未知原因')}"
@@ -250,7 +343,7 @@ class MuseUploader(threading.Thread):
             req_body = {
                 "param": self.transfer_info["transfer_code"]
             }
-            resp = requests.post(url=req_url, json=req_body, headers=self.auth_headers)
+            resp = self.session.post(url=req_url, json=req_body, headers=self.auth_headers)
             resp_json = resp.json()
             if resp_json.get("code") != "0":
                 self.err = f"请求获取上传凭证失败：{resp_json.get('message', '未知原因')}"
@@ -261,96 +354,145 @@ class MuseUploader(threading.Thread):
             self.err = f"异常：{exc}"
             return False
 
+    def pack_file(self, size: int) -> tuple:
+        """打包文件的文件信息"""
+        pack_name = f"{os.path.basename(os.path.abspath(self.upload_path))}.{self.pack}"
+        return len(self.file_dict) + 1, {
+            "abs_path": "",
+            "upl_path": pack_name,
+            "file_name": pack_name,
+            "uuid_name": str(uuid.uuid4()).replace("-", "") + "." + self.pack,
+            "file_size": size,
+            "uploaded_size": 0.0,
+            "process": 0
+        }
+
     def upload_file(self):
         """上传文件"""
 
         # 进度条
         self.progress_bar_total = tqdm(
             total=sum([f["file_size"] for f in self.file_dict.values()]),
-            desc="进度", mininterval=0.1, unit="B", unit_scale=True, unit_divisor=1024
+            desc="进度", mininterval=0.1, unit="B", unit_scale=True, unit_divisor=1024,
+            disable=not self.progress
         )
         self.progress_bar_curr = tqdm(
             total=1, desc=f"当前", mininterval=0.1,
-            unit="B", unit_scale=True, unit_divisor=1024
+            unit="B", unit_scale=True, unit_divisor=1024, disable=not self.progress
         )
 
-        # 初始化 bucket 对象
-        bucket = oss2.Bucket(
-            auth=oss2.StsAuth(
-                access_key_id=self.transfer_info["upload_token"]["accessKeyId"],
-                access_key_secret=self.transfer_info["upload_token"]["accessKeySecret"],
-                security_token=self.transfer_info["upload_token"]["securityToken"]
-            ),
-            endpoint=self.transfer_info["upload_token"]["endpoint"],
-            bucket_name=self.transfer_info["upload_token"]["bucket"],
-            enable_crc=False  # 开启后因校验占用大量资源而可能会导致上传速度严重下降
-        )
-
-        # 上传切片
-        def upload_part(part_num, part_data):
-            """上传切片"""
-            if not self.action():
-                return False
-            upload_result = bucket.upload_part(
-                upl_path, upload_id, part_num, part_data
-            )
-            self.progress_bar_total.update(len(part_data))
-            self.progress_bar_curr.update(len(part_data))
-            self.file_dict[file_id]["uploaded_size"] += len(part_data)
-            parts.append(PartInfo(part_num, upload_result.etag))
-            return True
+        # 选择访问域名，初始化 bucket 对象
+        upload_token = self.transfer_info["upload_token"]
+        endpoint = upload_token["endpoint"]
+        if self.endpoint_selector:
+            with self.tracer.span("probe_endpoints"):
+                endpoint = self.endpoint_selector.choose(
+                    upload_token["bucket"], endpoint, self.get_bucket, f"{upload_token['pathPrefix']}/{uuid.uuid4().hex}"
+                )
+        self.endpoint, self.bucket = endpoint, self.get_bucket(endpoint)
 
         # 上传文件
-        for file_id, file_info in self.file_dict.items():
-            if not self.action():
-                return False
-            log(f"开始上传：{file_info['upl_path']}……")
-            self.progress_bar_curr.reset(file_info["file_size"])
-            self.progress_bar_curr.set_description(f"当前 {file_info['upl_path']}")
-            upl_path = self.transfer_info["upload_token"]["pathPrefix"] + "/" + file_info["uuid_name"]
-            upload_id = bucket.init_multipart_upload(upl_path).upload_id
-            parts = []
-            chunk_id, task_list = 0, []
-            self.executor = ThreadPoolExecutor(max_workers=self.threads)
-            with open(file_info["abs_path"], "rb") as f:
-                while True:
-                    if not self.action():
+        if self.processes:
+            self.data_plane = ProcessDataPlane(self.processes)
+        try:
+            for file_id, file_info in self.file_dict.items():
+                if not self.action():
+                    return False
+                if "dedup_of" in file_info:
+                    continue  # 随原文件绑定
+                try:
+                    with self.tracer.span("file", path=file_info["upl_path"], size=file_info["file_size"]):
+                        succeed = self.upload_one(file_id, file_info)
+                except Exception as exc:
+                    self.err, succeed = f"异常：{exc}", False
+                if not succeed:
+                    # 校验模式下记录错误并继续，待校验阶段重新上传
+                    if not self.verify or self.status == "cancel":
                         return False
-                    chunk_id += 1
-                    chunk_bytes = f.read(self.chunk_size)
-                    if len(chunk_bytes) != 0:
-                        task_list.append(self.executor.submit(upload_part, chunk_id, chunk_bytes))
-                        while [task.done() for task in task_list].count(False) > self.threads * 2:
-                            time.sleep(0.1)
-                        continue
-                    self.executor.shutdown()
-                    break
-            complete_result = bucket.complete_multipart_upload(upl_path, upload_id, parts)
-
-            # 绑定文件
-            req_body = {
-                "param": {
-                    "code": self.transfer_info["transfer_code"],
-                    "filePathList": [
-                        {
-                            "etag": complete_result.etag,
-                            "fileName": file_info["upl_path"].lstrip("\\"),
-                            "path": upl_path
-                        }
-                    ],
-                    "finish": 0
-                }
-            }
-            req_url = "https://open-auth.tezign.com/open-api/standard/simple/v1/muse/bindFile"
-            resp = requests.post(url=req_url, json=req_body, headers=self.auth_headers)
-            resp_json = resp.json()
-            if resp_json.get("code") != "0":
-                self.err = f"上传文件 {file_info['upl_path']} 失败：{resp_json.get('message', '未知原因')}"
-                self.close_progress_bar()
-                return False
-            log(f"上传完成：{file_info['upl_path']}")
+                    file_info["error"] = self.err
+                    log(f"上传失败：{file_info['upl_path']} {self.err}")
+        finally:
+            if self.data_plane:
+                self.data_plane.close()
+                self.data_plane = None
 
         self.close_progress_bar()
+        self.summarize_pack()
+        return True
+
+    def get_bucket(self, endpoint: str) -> oss2.Bucket:
+        """按访问域名获取 bucket 对象"""
+        if endpoint not in self.buckets:
+            self.buckets[endpoint] = oss2.Bucket(
+                auth=oss2.StsAuth(
+                    access_key_id=self.transfer_info["upload_token"]["accessKeyId"],
+                    access_key_secret=self.transfer_info["upload_token"]["accessKeySecret"],
+                    security_token=self.transfer_info["upload_token"]["securityToken"]
+                ),
+                endpoint=endpoint,
+                bucket_name=self.transfer_info["upload_token"]["bucket"],
+                session=self.oss_session,
+                enable_crc=False  # 开启后因校验占用大量资源而可能会导致上传速度严重下降
+            )
+        return self.buckets[endpoint]
+
+    def upload_one(self, file_id: int, file_info: dict) -> bool:
+        """上传单个文件"""
+        log(f"开始上传：{file_info['upl_path']}……")
+        self.progress_bar_curr.reset(file_info["file_size"])
+        self.progress_bar_curr.set_description(f"当前 {file_info['upl_path']}")
+        upload_token = self.transfer_info["upload_token"]
+        upl_path = upload_token["pathPrefix"] + "/" + file_info["uuid_name"]
+        with self.tracer.span("init_multipart_upload"):
+            upload_id = self.bucket.init_multipart_upload(upl_path).upload_id
+        parts = self.upload_parts(
+            file_id, file_info, self.get_bucket, upload_token["bucket"], self.endpoint, upl_path, upload_id,
+            (upload_token["accessKeyId"], upload_token["accessKeySecret"], upload_token["securityToken"])
+        )
+        if parts is None:
+            return False
+        complete_result, parts_checked = self.complete_checked(self.bucket, upl_path, upload_id, parts, file_info)
+        if complete_result is None:
+            return False
+
+        # 绑定文件，内容相同的文件复用同一对象
+        file_info["path"], file_info["etag"] = upl_path, complete_result.etag
+        file_info["object"] = {
+            "bucket": self.bucket,
+            "key": upl_path,
+            "size": file_info["packer"].packed_size if "packer" in file_info else file_info["file_size"],
+            "etag": complete_result.etag,
+            "parts_checked": parts_checked
+        }
+        if not self.bind_file(file_info):
+            return False
+        return self.bind_duplicates(file_id)
+
+    def bind_file(self, file_info: dict) -> bool:
+        """绑定文件"""
+        req_body = {
+            "param": {
+                "code": self.transfer_info["transfer_code"],
+                "filePathList": [
+                    {
+                        "etag": file_info["etag"],
+                        "fileName": file_info["upl_path"].lstrip("\\"),
+                        "path": file_info["path"]
+                    }
+                ],
+                "finish": 0
+            }
+        }
+        req_url = "https://open-auth.tezign.com/open-api/standard/simple/v1/muse/bindFile"
+        with self.tracer.span("bind"):
+            resp = self.session.post(url=req_url, json=req_body, headers=self.auth_headers)
+            resp_json = resp.json()
+        if resp_json.get("code") != "0":
+            self.err = f"上传文件 {file_info['upl_path']} 失败：{resp_json.get('message', '未知原因')}"
+            self.close_progress_bar()
+            return False
+        file_info["uploaded"] = True
+        log(f"上传完成：{file_info['upl_path']}")
         return True
 
     def finish(self):
@@ -360,7 +502,7 @@ class MuseUploader(threading.Thread):
             req_body = {
                 "param": self.transfer_info["transfer_code"]
             }
-            resp = requests.post(url=req_url, json=req_body, headers=self.auth_headers)
+            resp = self.session.post(url=req_url, json=req_body, headers=self.auth_headers)
             resp_json = resp.json()
             if resp_json.get("code") != "0":
                 self.err = f"请求完成传输失败：{resp_json.get('message', '未知原因')}"
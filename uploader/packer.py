@@ -0,0 +1,324 @@
+import os
+import time
+import zlib
+import struct
+import fnmatch
+import tarfile
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+PACK_FORMATS = ["tar.zst", "zip"]
+
+debug = False
+
+
+def log(text: str) -> str:
+    if debug:
+        print(text)
+    return text
+
+
+def select_files(file_dict: dict, max_size: int, pack_filter: tuple = ()) -> tuple:
+    """
+    划分打包文件与原样上传文件
+    :param file_dict: 待上传文件信息
+    :param max_size: 不大于此大小（单位：字节）的文件打包上传
+    :param pack_filter: 匹配文件名或相对路径的通配规则，以 ! 开头表示排除（排除优先）
+    :return: (打包文件信息, 原样上传文件信息)
+    """
+    includes = [p for p in pack_filter if not p.startswith("!")]
+    excludes = [p[1:] for p in pack_filter if p.startswith("!")]
+
+    def match(file_info: dict, patterns: list) -> bool:
+        names = [file_info["file_name"], arc_name(file_info)]
+        return any(fnmatch.fnmatch(name, p) for name in names for p in patterns)
+
+    packed, raw = {}, {}
+    for file_id, file_info in file_dict.items():
+        if match(file_info, excludes):
+            raw[file_id] = file_info
+        elif file_info["file_size"] <= max_size or match(file_info, includes):
+            packed[file_id] = file_info
+        else:
+            raw[file_id] = file_info
+    return packed, raw
+
+
+def arc_name(file_info: dict) -> str:
+    """归档内路径"""
+    rel_path = file_info.get("rel_path") or file_info.get("upl_path") or file_info["file_name"]
+    return rel_path.replace("\\", "/").lstrip("/")
+
+
+def compress_block(fmt: str, level: int, data: bytes, final: bool) -> tuple:
+    """压缩数据块（在子进程中执行），返回 (压缩数据, CPU 耗时)"""
+    start = time.process_time()
+    if fmt == "tar.zst":
+        import zstandard
+        out = zstandard.ZstdCompressor(level=level).compress(data)  # 各块为独立帧，可直接拼接
+    else:
+        # 各块为独立 raw deflate 流，非末块以 SYNC_FLUSH 对齐字节后可直接拼接
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        out = compressor.compress(data) + compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+    return out, time.process_time() - start
+
+
+def dos_datetime(timestamp: float) -> tuple:
+    """转换为 zip 使用的 DOS 日期时间"""
+    t = time.localtime(timestamp)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), \
+           ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+
+class Packer:
+
+    def __init__(self,
+                 file_dict: dict,
+                 fmt: str = "tar.zst",
+                 level: int = None,
+                 processes: int = None,
+                 block_size: int = 4194304):
+        """
+        流式打包压缩
+        :param file_dict: 待打包文件信息
+        :param fmt: 归档格式（tar.zst 或 zip）
+        :param level: 压缩级别（默认 tar.zst 为 3，zip 为 6）
+        :param processes: 压缩进程数（默认为 CPU 核心数）
+        :param block_size: 并行压缩的块大小（单位：字节，默认 4 MB）
+        """
+        if fmt not in PACK_FORMATS:
+            raise ValueError(f"不支持的打包格式：{fmt}")
+        if fmt == "tar.zst":
+            try:
+                import zstandard  # noqa: F401
+            except ImportError:
+                raise ImportError("打包为 tar.zst 需安装 zstandard")
+
+        self.file_dict = file_dict
+        self.fmt = fmt
+        self.level = level if level is not None else (3 if fmt == "tar.zst" else 6)
+        self.processes = processes or os.cpu_count() or 1
+        self.block_size = block_size
+
+        # 统计
+        self.raw_size = 0  # 已压缩的原始文件字节数
+        self.packed_size = 0  # 已产出的归档字节数
+        self.cpu_time = 0.0  # 压缩 CPU 耗时（各进程累计）
+        self.wall_time = 0.0  # 打包总耗时
+
+        self.entries = []  # zip 中央目录
+
+    @property
+    def ratio(self) -> float:
+        """压缩率"""
+        return self.packed_size / self.raw_size if self.raw_size else 0.0
+
+    def stream(self, chunk_size: int):
+        """
+        产出归档分块，除最后一块外均为 chunk_size 字节
+        :return: 生成器，产出 (分块数据, 本块对应的原始文件字节数)
+        """
+        start = time.time()
+        buffer, raw_delta = bytearray(), 0
+        # 以 spawn 方式启动压缩进程，避免在已有线程的进程中 fork
+        executor = ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context("spawn"))
+        pending = deque()
+        try:
+            items = self.tar_items() if self.fmt == "tar.zst" else self.zip_items()
+            for item in items:
+                if item[0] == "block":
+                    _, data, final, content_size, entry = item
+                    item = ("block", executor.submit(compress_block, self.fmt, self.level, data, final),
+                            content_size, entry)
+                pending.append(item)
+                # 限制在途块数，按顺序取回结果
+                while len(pending) > self.processes * 2 or (pending and pending[0][0] == "lazy"):
+                    raw_delta += self.consume(pending.popleft(), buffer)
+                    while len(buffer) >= chunk_size:
+                        yield bytes(buffer[:chunk_size]), raw_delta
+                        del buffer[:chunk_size]
+                        raw_delta = 0
+            while pending:
+                raw_delta += self.consume(pending.popleft(), buffer)
+                while len(buffer) >= chunk_size:
+                    yield bytes(buffer[:chunk_size]), raw_delta
+                    del buffer[:chunk_size]
+                    raw_delta = 0
+            if buffer or raw_delta:
+                yield bytes(buffer), raw_delta
+        finally:
+            for item in pending:
+                if item[0] == "block":
+                    item[1].cancel()
+            executor.shutdown(wait=False)
+            self.wall_time += time.time() - start
+
+    def consume(self, item: tuple, buffer: bytearray) -> int:
+        """按序写入一项到缓冲区，返回对应的原始文件字节数"""
+        if item[0] == "lazy":
+            data = item[1]()
+            content_size = 0
+        else:
+            _, future, content_size, entry = item
+            data, cpu_time = future.result()
+            self.cpu_time += cpu_time
+            if entry is not None:
+                entry["compress_size"] += len(data)
+        buffer += data
+        self.packed_size += len(data)
+        self.raw_size += content_size
+        return content_size
+
+    def tar_items(self):
+        """tar 流：整体按块压缩"""
+        buffer, content_size = bytearray(), 0
+        for file_info in self.file_dict.values():
+            stat = os.stat(file_info["abs_path"])
+            info = tarfile.TarInfo(arc_name(file_info))
+            info.size = stat.st_size
+            info.mtime = int(stat.st_mtime)
+            info.mode = stat.st_mode & 0o7777
+            buffer += info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+            size = 0
+            with open(file_info["abs_path"], "rb") as f:
+                while size < info.size:
+                    if len(buffer) >= self.block_size:
+                        yield "block", bytes(buffer), False, content_size, None
+                        buffer, content_size = bytearray(), 0
+                    data = f.read(min(self.block_size - len(buffer), info.size - size))
+                    if not data:
+                        raise IOError(f"文件在打包过程中被截断：{file_info['abs_path']}")
+                    buffer += data
+                    size += len(data)
+                    content_size += len(data)
+            if size % tarfile.BLOCKSIZE:
+                buffer += tarfile.NUL * (tarfile.BLOCKSIZE - size % tarfile.BLOCKSIZE)
+        buffer += tarfile.NUL * (tarfile.BLOCKSIZE * 2)
+        yield "block", bytes(buffer), True, content_size, None
+
+    def zip_items(self):
+        """zip 流：逐个成员按块压缩，头部与数据描述符原样写入"""
+        for file_info in self.file_dict.values():
+            stat = os.stat(file_info["abs_path"])
+            name = arc_name(file_info).encode("utf-8")
+            entry = {
+                "name": name,
+                "datetime": dos_datetime(stat.st_mtime),
+                "external_attr": (stat.st_mode & 0xFFFF) << 16,
+                "crc": 0,
+                "file_size": 0,
+                "compress_size": 0,
+                "offset": 0
+            }
+            self.entries.append(entry)
+            yield "lazy", lambda e=entry: self.zip_local_header(e)
+            with open(file_info["abs_path"], "rb") as f:
+                data = f.read(self.block_size)
+                while True:
+                    next_data = f.read(self.block_size) if data else b""
+                    entry["crc"] = zlib.crc32(data, entry["crc"])
+                    entry["file_size"] += len(data)
+                    yield "block", data, not next_data, len(data), entry
+                    if not next_data:
+                        break
+                    data = next_data
+            yield "lazy", lambda e=entry: struct.pack("<IIQQ", 0x08074B50, e["crc"], e["compress_size"], e["file_size"])
+        yield "lazy", self.zip_central_directory
+
+    def zip_local_header(self, entry: dict) -> bytes:
+        """本地文件头（大小未知，使用数据描述符与 zip64）"""
+        entry["offset"] = self.packed_size
+        extra = struct.pack("<HHQQ", 0x0001, 16, 0, 0)
+        dos_time, dos_date = entry["datetime"]
+        return struct.pack(
+            "<IHHHHHIIIHH", 0x04034B50, 45, 0x0808, zlib.DEFLATED, dos_time, dos_date,
+            0, 0xFFFFFFFF, 0xFFFFFFFF, len(entry["name"]), len(extra)
+        ) + entry["name"] + extra
+
+    def zip_central_directory(self) -> bytes:
+        """中央目录及目录结束记录"""
+        cd_offset, records = self.packed_size, []
+        for entry in self.entries:
+            zip64 = [v for v in (entry["file_size"], entry["compress_size"], entry["offset"]) if v >= 0xFFFFFFFF]
+            extra = struct.pack(f"<HH{len(zip64)}Q", 0x0001, 8 * len(zip64), *zip64) if zip64 else b""
+            dos_time, dos_date = entry["datetime"]
+            records.append(struct.pack(
+                "<IHHHHHHIIIHHHHHII", 0x02014B50, (3 << 8) | 45, 45, 0x0808, zlib.DEFLATED, dos_time, dos_date,
+                entry["crc"], min(entry["compress_size"], 0xFFFFFFFF), min(entry["file_size"], 0xFFFFFFFF),
+                len(entry["name"]), len(extra), 0, 0, 0, entry["external_attr"], min(entry["offset"], 0xFFFFFFFF)
+            ) + entry["name"] + extra)
+        central_directory = b"".join(records)
+        cd_size, count = len(central_directory), len(self.entries)
+        end = b""
+        if count >= 0xFFFF or cd_size >= 0xFFFFFFFF or cd_offset >= 0xFFFFFFFF:
+            zip64_offset = cd_offset + cd_size
+            end += struct.pack("<IQHHIIQQQQ", 0x06064B50, 44, 45, 45, 0, 0, count, count, cd_size, cd_offset)
+            end += struct.pack("<IIQI", 0x07064B50, 0, zip64_offset, 1)
+        end += struct.pack(
+            "<IHHHHIIH", 0x06054B50, 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+            min(cd_size, 0xFFFFFFFF), min(cd_offset, 0xFFFFFFFF), 0
+        )
+        return central_directory + end
+
+
+class PackMixin:
+    """
+    上传类的打包步骤，子类需提供 pack 系列参数、file_dict、upload_info、chunk_size、tracer，
+    并实现 pack_file(size) 返回打包文件的 (文件ID, 文件信息)，size 为打包前大小，用于进度
+    """
+
+    def init_pack(self):
+        """打包文件"""
+        if not self.pack:
+            return True
+        packed, raw = select_files(self.file_dict, self.pack_max_size, self.pack_filter)
+        if not packed:
+            return True
+        try:
+            packer = Packer(packed, self.pack, self.pack_level, self.pack_processes)
+        except (ValueError, ImportError) as exc:
+            self.err = f"错误：{exc}"
+            return False
+        file_id, file_info = self.pack_file(sum(f["file_size"] for f in packed.values()))
+        file_info["packer"] = packer
+        self.file_dict = raw
+        self.file_dict[file_id] = file_info
+        self.upload_info["pack"] = {"format": self.pack, "files": len(packed)}
+        log(f"打包文件：{len(packed)} 个文件将打包为 {file_info['file_name']}")
+        return True
+
+    def read_chunks(self, file_info: dict):
+        """读取分块，产出 (分块数据, 计入进度的字节数)"""
+        if "packer" in file_info:
+            stream = file_info["packer"].stream(self.chunk_size)
+            while True:
+                with self.tracer.span("pack"):
+                    chunk = next(stream, None)
+                if chunk is None:
+                    break
+                yield chunk
+            return
+        with open(file_info["abs_path"], "rb") as f:
+            while True:
+                with self.tracer.span("read"):
+                    chunk_bytes = f.read(self.chunk_size)
+                if len(chunk_bytes) == 0:
+                    break
+                yield chunk_bytes, len(chunk_bytes)
+
+    def summarize_pack(self):
+        """汇总打包信息"""
+        for file_info in self.file_dict.values():
+            if "packer" not in file_info:
+                continue
+            packer = file_info["packer"]
+            self.upload_info["pack"].update({
+                "raw_size": packer.raw_size,  # 原始大小
+                "packed_size": packer.packed_size,  # 压缩后大小
+                "ratio": packer.ratio,  # 压缩率
+                "cpu_time": packer.cpu_time,  # 压缩 CPU 耗时
+                "pack_time": packer.wall_time  # 打包耗时
+            })
@@ -0,0 +1,129 @@
+import time
+from oss2.models import PartInfo
+from concurrent.futures import ThreadPoolExecutor
+from .adaptive import RETRIES, is_throttled
+
+debug = False
+
+
+def log(text: str) -> str:
+    if debug:
+        print(text)
+    return text
+
+
+class PartUploadMixin:
+    """
+    上传类的分片上传：并发配额、自适应重试与多进程分发
+    子类需提供 limiter、adaptive、threads、chunk_size、tracer、endpoint_selector、data_plane、进度条等属性，
+    以及 action 与 read_chunks
+    """
+
+    def upload_parts(self, file_id, file_info: dict, get_bucket, bucket_name: str, endpoint: str,
+                     key: str, upload_id: str, auth_args: tuple):
+        """
+        上传文件的全部分片
+        :param get_bucket: 按访问域名获取 bucket 对象的函数
+        :param endpoint: 访问域名
+        :param auth_args: (access_key_id, access_key_secret, security_token)，供多进程模式使用
+        :return: PartInfo 列表，已取消时返回 None，分片上传失败时抛出异常
+        """
+        if self.data_plane and "packer" not in file_info and file_info["file_size"] > self.chunk_size:
+            # 多进程上传：各工作进程映射源文件并使用独立连接上传分片
+            with self.tracer.span("process_upload"):
+                return self.data_plane.upload(
+                    auth_args, lambda: self.part_endpoint(bucket_name, endpoint), bucket_name, key, upload_id,
+                    file_info["abs_path"], file_info["file_size"], self.chunk_size, self.limiter, self.action,
+                    lambda result: self.record_part(file_id, bucket_name, result), RETRIES if self.adaptive else 0
+                )
+
+        parts = []
+
+        def upload_part(part_num, part_data, progress_size):
+            """上传分片"""
+            if not self.action():
+                return False
+            etag, seconds = self.send_part(get_bucket, bucket_name, endpoint, key, upload_id, part_num, part_data)
+            self.update_progress(file_id, progress_size, seconds)
+            parts.append(PartInfo(part_num, etag))
+            return True
+
+        chunk_id, task_list = 0, []
+        self.executor = ThreadPoolExecutor(max_workers=self.threads)
+        for chunk_bytes, progress_size in self.read_chunks(file_info):
+            if not self.action():
+                return None
+            chunk_id += 1
+            task_list.append(self.executor.submit(upload_part, chunk_id, chunk_bytes, progress_size))
+            with self.tracer.span("backpressure"):
+                while [task.done() for task in task_list].count(False) > self.threads * 2:
+                    time.sleep(0.1)
+        with self.tracer.span("drain"):
+            self.executor.shutdown()
+        # 分片失败时抛出其异常，已取消（分片未上传）时返回 None
+        if not all([task.result() for task in task_list]):
+            return None
+        if len(parts) != chunk_id:
+            raise RuntimeError(f"分片不完整：已上传 {len(parts)} 个，应为 {chunk_id} 个")
+        return parts
+
+    def send_part(self, get_bucket, bucket_name: str, endpoint: str, key: str, upload_id: str,
+                  part_num: int, part_data: bytes) -> tuple:
+        """
+        在并发配额内上传一个分片，自适应模式下遇到限流等错误时缩减并发并重试
+        :return: (etag, 耗时)
+        """
+        for attempt in range(RETRIES + 1):
+            with self.tracer.span("limiter"):
+                self.limiter.acquire()
+            part_endpoint = self.part_endpoint(bucket_name, endpoint)
+            try:
+                with self.tracer.span("upload_part", part=part_num, size=len(part_data), endpoint=part_endpoint):
+                    start = time.time()
+                    upload_result = get_bucket(part_endpoint).upload_part(key, upload_id, part_num, part_data)
+            except Exception as exc:
+                if not self.adaptive or not is_throttled(exc) or attempt == RETRIES:
+                    raise
+                self.limiter.record(time.time() - start, len(part_data), error=True)
+                log(f"分片 {part_num} 上传失败，重试：{exc}")
+                time.sleep(attempt + 1)
+                continue
+            finally:
+                self.limiter.release()
+            break
+        seconds = time.time() - start
+        if self.adaptive:
+            self.limiter.record(seconds, len(part_data))
+        if self.endpoint_selector:
+            self.endpoint_selector.record(bucket_name, part_endpoint, seconds, len(part_data))
+        return upload_result.etag, seconds
+
+    def part_endpoint(self, bucket_name: str, endpoint: str) -> str:
+        """分片使用的访问域名（测速后可能已切换）"""
+        return self.endpoint_selector.current(bucket_name, endpoint) if self.endpoint_selector else endpoint
+
+    def record_part(self, file_id, bucket_name: str, result: dict):
+        """多进程模式下记录工作进程返回的分片结果"""
+        seconds = result["end"] - result["start"]
+        args = {"part": result["part_num"], "size": result["size"], "endpoint": result["endpoint"]}
+        if result["error"]:
+            args["error"] = result["error"]
+        self.tracer.record_process("upload_part", result["start"], result["end"], result["pid"], args)
+        if self.adaptive:
+            self.limiter.record(seconds, result["size"], error=bool(result["error"]))
+        if result["error"]:
+            log(result["error"])
+            return
+        if self.endpoint_selector:
+            self.endpoint_selector.record(bucket_name, result["endpoint"], seconds, result["size"])
+        self.update_progress(file_id, result["size"], seconds)
+
+    def update_progress(self, file_id, progress_size: int, seconds: float):
+        """分片完成后更新进度"""
+        with self.lock:
+            self.upload_info["network_time"] += seconds
+        self.progress_bar_total.update(progress_size)
+        self.progress_bar_curr.update(progress_size)
+        self.file_dict[file_id]["uploaded_size"] += progress_size
+        if self.adaptive:
+            self.progress_bar_total.set_postfix_str(f"并发 {self.limiter.limit}", refresh=False)
@@ -0,0 +1,299 @@
+import os
+import json
+import time
+import uuid
+import oss2
+import requests
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .cowtransfer import CowUploader
+from .musetransfer import MuseUploader
+
+debug = False
+
+
+def log(text: str) -> str:
+    if debug:
+        print(text)
+    return text
+
+
+UPLOADERS = {
+    "cow": CowUploader,
+    "muse": MuseUploader
+}
+
+
+class UploadServer:
+
+    def __init__(self,
+                 host: str = "127.0.0.1",
+                 port: int = 7070,
+                 unix_socket: str = "",
+                 max_parts: int = 16,
+                 token_ttl: int = 1800,
+                 job_ttl: int = 3600):
+        """
+        上传守护进程
+        :param host: 监听地址（默认 127.0.0.1）
+        :param port: 监听端口（默认 7070）
+        :param unix_socket: Unix 套接字路径，指定后不再监听 TCP 端口
+        :param max_parts: 所有任务共享的分片并发上限（默认 16）
+        :param token_ttl: 访问令牌缓存有效期（单位：秒，默认 1800）
+        :param job_ttl: 已结束任务的保留时长，超时后移除（单位：秒，默认 3600）
+
+        接口（请求与响应均为 JSON）：
+            POST /jobs                 提交任务，{"type": "cow" 或 "muse", ...上传类参数}，返回 {"id": 任务ID}
+            GET  /jobs                 全部任务状态
+            GET  /jobs/<id>            任务状态与进度
+            POST /jobs/<id>/pause      暂停
+            POST /jobs/<id>/work       继续
+            POST /jobs/<id>/cancel     取消
+            DELETE /jobs/<id>          移除已结束的任务
+
+        所有任务共享 max_parts 分片配额，因此不接受 adaptive、min_threads 参数
+        """
+        self.host = host
+        self.port = port
+        self.unix_socket = unix_socket
+        self.max_parts = max_parts
+        self.token_ttl = token_ttl
+        self.job_ttl = job_ttl
+
+        # 常驻状态
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.url_prefix = {}  # authorization -> 专属域名前缀
+        self.auth_headers = {}  # (client_id, client_key) -> (访问令牌请求头, 过期时间)
+        self.limiter = threading.BoundedSemaphore(max_parts)
+        oss2.defaults.connection_pool_size = max(oss2.defaults.connection_pool_size, max_parts)
+        self.oss_session = oss2.Session()
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=max_parts, max_retries=3)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.httpd = None
+
+    def submit(self, params: dict) -> str:
+        """提交任务"""
+        params = dict(params)
+        kind = params.pop("type", "")
+        if kind not in UPLOADERS:
+            raise ValueError(f"未知的任务类型：{kind}")
+        for key in ["session", "oss_session", "limiter", "progress"]:
+            params.pop(key, None)
+        for key in ["adaptive", "min_threads"]:
+            if key in params:
+                raise ValueError(f"服务模式下分片并发由 max_parts 统一限制，不支持参数 {key}")
+        self.evict()
+        uploader = UPLOADERS[kind](
+            session=self.session, oss_session=self.oss_session, limiter=self.limiter, progress=False, **params
+        )
+        self.warm_up(kind, uploader)
+        job_id = uuid.uuid4().hex[:12]
+        with self.lock:
+            self.jobs[job_id] = {"type": kind, "uploader": uploader, "created": time.time(), "finished": None}
+        threading.Thread(target=self.run_job, args=(job_id,), daemon=True).start()
+        log(f"提交任务：{job_id}（{kind}）")
+        return job_id
+
+    def warm_up(self, kind: str, uploader):
+        """预置已缓存的认证信息"""
+        with self.lock:
+            if kind == "cow" and uploader.authorization in self.url_prefix:
+                uploader.upload_info["url_prefix"] = self.url_prefix[uploader.authorization]
+            if kind == "muse":
+                headers, expire = self.auth_headers.get((uploader.client_id, uploader.client_key), ({}, 0))
+                if expire > time.time():
+                    uploader.auth_headers = dict(headers)
+
+    def keep_warm(self, kind: str, uploader):
+        """缓存任务获取的认证信息"""
+        with self.lock:
+            if kind == "cow" and uploader.upload_info.get("url_prefix"):
+                self.url_prefix[uploader.authorization] = uploader.upload_info["url_prefix"]
+            if kind == "muse" and uploader.auth_headers:
+                key = (uploader.client_id, uploader.client_key)
+                if self.auth_headers.get(key, ({}, 0))[0] != uploader.auth_headers:
+                    self.auth_headers[key] = (dict(uploader.auth_headers), time.time() + self.token_ttl)
+
+    def run_job(self, job_id: str):
+        """执行任务"""
+        job = self.jobs[job_id]
+        uploader = job["uploader"]
+        try:
+            uploader.start_upload()
+        except Exception as exc:
+            uploader.err = f"异常：{exc}"
+        self.keep_warm(job["type"], uploader)
+        job["finished"] = time.time()
+        # 保留任务信息，释放上传对象（文件列表、打包器、进度条等）
+        info = self.build_info(job_id, dict(job))
+        with self.lock:
+            job["info"], job["uploader"] = info, None
+        log(f"任务结束：{job_id} {info['status']}")
+
+    def evict(self):
+        """移除超过保留时长的已结束任务"""
+        expire = time.time() - self.job_ttl
+        with self.lock:
+            for job_id in [k for k, job in self.jobs.items() if job["finished"] and job["finished"] < expire]:
+                del self.jobs[job_id]
+
+    def snapshot(self, job_id: str) -> dict:
+        """任务当前状态的副本，任务不存在（或已移除）时抛出 KeyError"""
+        with self.lock:
+            return dict(self.jobs[job_id])
+
+    def remove(self, job_id: str) -> bool:
+        """移除已结束的任务，任务未结束时返回 False，任务不存在时抛出 KeyError"""
+        with self.lock:
+            if not self.jobs[job_id]["finished"]:
+                return False
+            del self.jobs[job_id]
+            return True
+
+    @staticmethod
+    def job_status(job: dict) -> str:
+        """任务状态"""
+        uploader = job["uploader"]
+        if job["finished"] is None:
+            return "paused" if uploader.status == "pause" else "running"
+        if uploader.upload_info.get("complete"):
+            return "complete"
+        return "cancelled" if uploader.status == "cancel" else "failed"
+
+    def job_info(self, job_id: str) -> dict:
+        """任务信息，任务不存在时抛出 KeyError"""
+        job = self.snapshot(job_id)
+        if job.get("info"):
+            return job["info"]
+        return self.build_info(job_id, job)
+
+    def build_info(self, job_id: str, job: dict) -> dict:
+        """由任务副本生成任务信息"""
+        uploader = job["uploader"]
+        files = list(uploader.file_dict.values())
+        return {
+            "id": job_id,
+            "type": job["type"],
+            "status": self.job_status(job),
+            "err": uploader.err,
+            "total_size": sum(f["file_size"] for f in files),
+            "uploaded_size": sum(f["uploaded_size"] for f in files),
+            "files": len(files),
+            "created": job["created"],
+            "finished": job["finished"],
+            "transfer_url": uploader.upload_info.get("transfer_url"),
+            "transfer_code": uploader.upload_info.get("transfer_code")
+        }
+
+    def control(self, job_id: str, action: str):
+        """暂停、继续或取消任务，任务不存在时抛出 KeyError"""
+        uploader = self.snapshot(job_id)["uploader"]
+        if uploader is None:
+            return  # 任务已结束
+        {"pause": uploader.pause, "work": uploader.work, "cancel": uploader.cancel}[action]()
+
+    def serve_forever(self):
+        """启动服务"""
+        if self.unix_socket:
+            if os.path.exists(self.unix_socket):
+                os.remove(self.unix_socket)
+            self.httpd = UnixHTTPServer(self.unix_socket, make_handler(self))
+            print(f"监听：{self.unix_socket}")
+        else:
+            self.httpd = ThreadingHTTPServer((self.host, self.port), make_handler(self))
+            print(f"监听：http://{self.host}:{self.port}")
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.httpd.server_close()
+            if self.unix_socket and os.path.exists(self.unix_socket):
+                os.remove(self.unix_socket)
+
+    def shutdown(self):
+        """停止服务并取消所有任务"""
+        with self.lock:
+            uploaders = [job["uploader"] for job in self.jobs.values() if job["uploader"]]
+        for uploader in uploaders:
+            uploader.cancel()
+        if self.httpd:
+            self.httpd.shutdown()
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_handler(server: UploadServer):
+    """创建请求处理类"""
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def log_message(self, format, *args):
+            log(format % args)
+
+        def reply(self, code: int, data):
+            body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def route(self) -> list:
+            return [p for p in self.path.split("?")[0].split("/") if p]
+
+        def do_GET(self):
+            route = self.route()
+            server.evict()
+            if route == ["jobs"]:
+                infos = []
+                for job_id in list(server.jobs):
+                    try:
+                        infos.append(server.job_info(job_id))
+                    except KeyError:
+                        pass  # 已被移除
+                return self.reply(200, infos)
+            if len(route) == 2 and route[0] == "jobs":
+                try:
+                    return self.reply(200, server.job_info(route[1]))
+                except KeyError:
+                    pass
+            self.reply(404, {"err": "未找到"})
+
+        def do_DELETE(self):
+            route = self.route()
+            if len(route) == 2 and route[0] == "jobs":
+                try:
+                    if not server.remove(route[1]):
+                        return self.reply(409, {"err": "任务未结束，请先取消"})
+                    return self.reply(200, {"id": route[1]})
+                except KeyError:
+                    pass
+            self.reply(404, {"err": "未找到"})
+
+        def do_POST(self):
+            route = self.route()
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                params = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                return self.reply(400, {"err": "请求体不是有效的 JSON"})
+            if route == ["jobs"]:
+                try:
+                    return self.reply(200, {"id": server.submit(params)})
+                except (TypeError, ValueError) as exc:
+                    return self.reply(400, {"err": str(exc)})
+            if len(route) == 3 and route[0] == "jobs" and route[2] in ["pause", "work", "cancel"]:
+                try:
+                    server.control(route[1], route[2])
+                    return self.reply(200, server.job_info(route[1]))
+                except KeyError:
+                    pass
+            self.reply(404, {"err": "未找到"})
+
+    return Handler
@@ -0,0 +1,149 @@
+import os
+import json
+import time
+import threading
+import unicodedata
+
+
+class Span:
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer, name: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self.args["error"] = repr(exc_val)
+        self.tracer.record(self.name, self.start, time.perf_counter(), self.args)
+        return False
+
+
+class NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class NullTracer:
+    """未启用追踪时使用，不记录任何数据"""
+    enabled = False
+
+    def span(self, name: str, **args) -> NullSpan:
+        return NULL_SPAN
+
+    def record_process(self, name: str, start: float, end: float, pid: int, args: dict):
+        pass
+
+
+class Tracer:
+    """记录各阶段耗时，导出 Chrome / Perfetto trace-event 格式"""
+    enabled = True
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = []
+        self.threads = {}
+        self.origin = time.perf_counter()
+        self.wall_offset = self.origin - time.time()  # time.time() 换算为 perf_counter 的偏移
+        self.pid = os.getpid()
+
+    def span(self, name: str, **args) -> Span:
+        """计时区间，用作上下文管理器"""
+        return Span(self, name, args)
+
+    def record(self, name: str, start: float, end: float, args: dict):
+        """记录一个区间"""
+        thread = threading.current_thread()
+        with self.lock:
+            self.threads[thread.ident] = thread.name
+            self.events.append((name, start, end, thread.ident, args))
+
+    def record_process(self, name: str, start: float, end: float, pid: int, args: dict):
+        """记录其他进程中的区间（时间为 time.time()），按进程号显示为单独一行"""
+        with self.lock:
+            self.threads[pid] = f"进程 {pid}"
+            self.events.append((name, start + self.wall_offset, end + self.wall_offset, pid, args))
+
+    def trace_events(self) -> list:
+        """trace-event 列表（时间单位：微秒）"""
+        events = [{
+            "name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": name}
+        } for tid, name in self.threads.items()]
+        for name, start, end, tid, args in self.events:
+            events.append({
+                "name": name, "cat": "upload", "ph": "X", "pid": self.pid, "tid": tid,
+                "ts": round((start - self.origin) * 1e6, 3), "dur": round((end - start) * 1e6, 3), "args": args
+            })
+        return events
+
+    def dump(self, path: str):
+        """写入 trace 文件，可用 chrome://tracing 或 ui.perfetto.dev 打开"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": self.trace_events(), "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+
+    def summary(self) -> list:
+        """按阶段汇总耗时分位数（单位：秒）"""
+        durations = {}
+        for name, start, end, _, _ in self.events:
+            durations.setdefault(name, []).append(end - start)
+        rows = []
+        for name, values in durations.items():
+            values.sort()
+            rows.append({
+                "stage": name,
+                "count": len(values),
+                "total": sum(values),
+                "p50": percentile(values, 50),
+                "p90": percentile(values, 90),
+                "p99": percentile(values, 99),
+                "max": values[-1]
+            })
+        return sorted(rows, key=lambda r: r["total"], reverse=True)
+
+    def format_summary(self) -> str:
+        """汇总表"""
+        header = ["阶段", "次数", "总计(秒)", "p50(毫秒)", "p90(毫秒)", "p99(毫秒)", "最大(毫秒)"]
+        lines = [header]
+        for row in self.summary():
+            lines.append([row["stage"], str(row["count"]), f"{row['total']:.3f}"] +
+                         [f"{row[k] * 1000:.1f}" for k in ["p50", "p90", "p99", "max"]])
+        widths = [max(display_width(line[i]) for line in lines) for i in range(len(header))]
+        return "\n".join(
+            "  ".join(pad(cell, widths[i], left=i == 0) for i, cell in enumerate(line)) for line in lines
+        )
+
+
+def percentile(values: list, p: float) -> float:
+    """分位数（最近秩法，values 需已排序）"""
+    if not values:
+        return 0.0
+    rank = max(int(-(-len(values) * p // 100)), 1)
+    return values[rank - 1]
+
+
+def display_width(text: str) -> int:
+    """终端显示宽度（全角字符计为 2）"""
+    return sum(2 if unicodedata.east_asian_width(c) in "WF" else 1 for c in text)
+
+
+def pad(text: str, width: int, left: bool = False) -> str:
+    """按显示宽度补齐"""
+    fill = " " * (width - display_width(text))
+    return text + fill if left else fill + text
+
+
+NULL_TRACER = NullTracer()
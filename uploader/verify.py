@@ -0,0 +1,201 @@
+import json
+import oss2
+from concurrent.futures import ThreadPoolExecutor
+from .packer import Packer
+
+# 校验失败后重新上传的最多轮数
+VERIFY_ROUNDS = 2
+
+debug = False
+
+
+def log(text: str) -> str:
+    if debug:
+        print(text)
+    return text
+
+
+def check_object(file_info: dict, bound: bool) -> dict:
+    """
+    检查是否已绑定，并通过 HEAD 请求校验已上传对象的大小与 etag
+    无权 HEAD 时（凭证按对象签发，未必允许读取），以完成上传前核对过的分片列表为准
+    :param file_info: 文件信息，上传完成后含 "object": {"bucket", "key", "size", "etag", "parts_checked"}
+    :param bound: 是否已绑定
+    :return: {"status": ok / failed / unbound / unverified, "reason": 原因}
+    """
+    obj = file_info.get("object")
+    if not obj:
+        return {"status": "failed", "reason": file_info.get("error") or "未完成上传"}
+    if not bound:
+        return {"status": "unbound", "reason": file_info.get("error") or "未绑定"}
+    try:
+        head = obj["bucket"].head_object(obj["key"])
+    except oss2.exceptions.NotFound:
+        return {"status": "failed", "reason": "对象不存在"}
+    except Exception as exc:
+        if obj.get("parts_checked"):
+            return {"status": "ok", "reason": "已按分片列表校验"}
+        if isinstance(exc, oss2.exceptions.AccessDenied):
+            return {"status": "unverified", "reason": "无权读取对象信息"}
+        return {"status": "unverified", "reason": f"异常：{exc}"}
+    if head.content_length != obj["size"]:
+        return {"status": "failed", "reason": f"大小不符：{head.content_length}，应为 {obj['size']}"}
+    if obj["etag"] and (head.etag or "").upper() != obj["etag"].upper():
+        return {"status": "failed", "reason": f"etag 不符：{head.etag}，应为 {obj['etag']}"}
+    return {"status": "ok", "reason": ""}
+
+
+def check_parts(bucket, key: str, upload_id: str, parts: list, size: int, chunk_size: int):
+    """
+    完成上传前核对服务端已接收的分片（按对象大小与分块大小应有的分片齐全、etag 与上传结果一致、总大小正确）
+    :param parts: 上传分片返回的 PartInfo 列表
+    :param size: 对象应有大小
+    :param chunk_size: 分块大小
+    :return: 不一致的原因，一致时返回空字符串，无法列出分片时返回 None
+    """
+    try:
+        remote = list(oss2.PartIterator(bucket, key, upload_id))
+    except oss2.exceptions.OssError as exc:
+        log(f"无法列出分片：{exc}")
+        return None
+    local = {p.part_number: p.etag for p in parts}
+    expected = set(range(1, -(-size // chunk_size) + 1))
+    missing = sorted(expected - {p.part_number for p in remote})
+    if missing:
+        return f"分片不完整：缺少分片 {', '.join(map(str, missing))}（已接收 {len(remote)} 个，应为 {len(expected)} 个）"
+    extra = sorted(p.part_number for p in remote if p.part_number not in expected)
+    if extra:
+        return f"分片多余：{', '.join(map(str, extra))}"
+    for part in remote:
+        if (part.etag or "").upper() != (local.get(part.part_number) or "").upper():
+            return f"分片 {part.part_number} etag 不符"
+    if sum(p.size for p in remote) != size:
+        return f"分片总大小不符：{sum(p.size for p in remote)}，应为 {size}"
+    return ""
+
+
+def reset_file(file_info: dict):
+    """重置文件上传状态以便重新上传"""
+    for key in ["object", "content_id", "origin_url", "path", "etag", "error"]:
+        file_info.pop(key, None)
+    file_info["uploaded"] = False
+    file_info["uploaded_size"] = 0
+    if "packer" in file_info:
+        packer = file_info["packer"]
+        file_info["packer"] = Packer(packer.file_dict, packer.fmt, packer.level, packer.processes)
+        file_info["file_size"] = sum(f["file_size"] for f in packer.file_dict.values())
+
+
+def summarize(details: list) -> dict:
+    """汇总校验结果"""
+    report = {"files": len(details)}
+    for status in ["ok", "failed", "unbound", "unverified"]:
+        report[status] = sum(1 for d in details if d["status"] == status)
+    report["reuploaded"] = sum(1 for d in details if d["attempts"])
+    report["details"] = details
+    return report
+
+
+def write_report(path: str, report: dict):
+    """写入校验报告（JSON）"""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+class VerifyMixin:
+    """
+    上传类的校验步骤，子类需提供 verify、verify_report、threads、file_dict、upload_info、duplicates、tracer，
+    以及 action、upload_one、bind_file、summarize_pack
+    path_key 为文件信息中用于日志与报告的路径字段
+    """
+    path_key = "rel_path"
+
+    def is_bound(self, file_info: dict) -> bool:
+        """文件是否已绑定"""
+        return bool(file_info.get("uploaded"))
+
+    def complete_checked(self, bucket, key: str, upload_id: str, parts: list, file_info: dict):
+        """
+        完成分片上传，校验模式下先核对分片，不一致时取消上传
+        :return: (complete_multipart_upload 结果, 分片是否已核对)，分片不一致时返回 (None, False)
+        """
+        parts_checked = False
+        if self.verify:
+            size = file_info["packer"].packed_size if "packer" in file_info else file_info["file_size"]
+            with self.tracer.span("check_parts"):
+                reason = check_parts(bucket, key, upload_id, parts, size, self.chunk_size)
+            if reason:
+                self.err = f"错误：{reason}"
+                bucket.abort_multipart_upload(key, upload_id)
+                return None, False
+            parts_checked = reason is not None
+        with self.tracer.span("complete_multipart_upload"):
+            return bucket.complete_multipart_upload(key, upload_id, parts), parts_checked
+
+    def verify_files(self):
+        """校验文件，重新上传校验失败的文件并生成报告"""
+        if not self.verify:
+            return True
+        results, attempts = {}, dict.fromkeys(self.file_dict, 0)
+        pending, stuck = list(self.file_dict), set()  # stuck：已绑定的对象校验失败，无法替换
+        executor = ThreadPoolExecutor(max_workers=self.threads)
+        try:
+            for round_num in range(VERIFY_ROUNDS + 1):
+                with self.tracer.span("verify", files=len(pending)):
+                    results.update(zip(pending, executor.map(
+                        lambda i: check_object(self.file_dict[i], self.is_bound(self.file_dict[i])), pending
+                    )))
+                pending = [i for i in pending if results[i]["status"] in ["failed", "unbound"] and i not in stuck]
+                if not pending or round_num == VERIFY_ROUNDS:
+                    break
+                for file_id in pending:
+                    if not self.action():
+                        return False
+                    log(f"校验失败：{self.file_dict[file_id][self.path_key]} {results[file_id]['reason']}")
+                    if results[file_id]["status"] == "failed" and self.is_bound(self.file_dict[file_id]):
+                        # 重新上传会在分享中留下损坏的副本，只报告失败
+                        results[file_id]["reason"] += "（已绑定，无法替换）"
+                        stuck.add(file_id)
+                        continue
+                    attempts[file_id] += 1
+                    self.retry_file(file_id, results[file_id]["status"], pending)
+        finally:
+            executor.shutdown()
+
+        # 校验报告
+        report = self.upload_info["verify"] = summarize([{
+            "path": file_info[self.path_key],
+            "size": file_info["file_size"],
+            "attempts": attempts[file_id],
+            **results[file_id]
+        } for file_id, file_info in self.file_dict.items()])
+        if self.verify_report:
+            write_report(self.verify_report, report)
+        if any(attempts.values()):
+            self.summarize_pack()
+        if report["failed"] or report["unbound"]:
+            self.err = f"错误：{report['failed'] + report['unbound']} 个文件校验失败"
+            return False
+        # 无法校验（凭证既不允许列出分片也不允许读取对象信息）不代表上传有误，记入报告后继续完成传输
+        for detail in report["details"]:
+            if detail["status"] == "unverified":
+                log(f"无法校验：{detail['path']} {detail['reason']}")
+        self.err = ""  # 失败的文件已重新上传
+        return True
+
+    def retry_file(self, file_id, status: str, failed_ids: list) -> bool:
+        """重新绑定未绑定的文件，或重新上传未绑定且对象有误的文件"""
+        file_info = self.file_dict[file_id]
+        if file_info.get("dedup_of") in failed_ids:
+            return True  # 随原文件重新上传
+        try:
+            if status == "unbound":
+                succeed = self.bind_file(file_info)
+            else:
+                reset_file(file_info)  # 已绑定的相同文件保持不变，其余随原文件绑定
+                succeed = self.upload_one(file_id, file_info)
+        except Exception as exc:
+            self.err, succeed = f"异常：{exc}", False
+        if not succeed:
+            file_info["error"] = self.err
+        return succeed